@@ -1,22 +1,43 @@
 import os
+import threading
+import time
 from functools import wraps
-from flask import Flask, request, redirect, render_template, session, url_for, flash
+import click
+from flask import Flask, Response, abort, request, redirect, render_template, session, url_for, flash, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from models import init_db, db
+from models import (
+    init_db, init_app as init_db_app, db, check_query_plans, company_choices, company_for_user, company_jobs_page,
+    developer_current_jobs, first_price_ts, open_jobs_page, search_open_jobs,
+    price_history_series, dashboard_summary, rebuild_dashboard_summaries, record_job_transition, JOBS_PAGE_SIZE
+)
 from services.algorand import (
-    generate_wallet, fund_account, create_asa, ensure_opt_in,
-    deploy_price_app, update_token_price, get_app_state, atomic_approve_and_pay,
-    SCALE_GBP
+    algod_transport_stats, app_state_fetch_stats, confirmation_stats, suggested_params_stats,
+    warm_program_cache, SCALE_GBP
+)
+from services.scheduler import add_periodic_jobs
+from services.wallet_pool import claim_wallet, fund_claimed_wallets_async, wallet_pool_stats
+from services.onboarding import start_onboarding, onboarding_status, IN_PROGRESS_STATUSES
+from services.opt_ins import opt_in_for_job_async, opt_in_stats
+from services.signers import signer_cache_stats
+from services.metrics import (
+    init_app as init_metrics_app, metrics_authorized, register_collector, render_prometheus, count_swallowed,
+    METRICS_TOKEN
+)
+from services.events import bus as event_bus, event_stats, last_event_id
+from services.job_import import detect_format, import_jobs, iter_rows
+from services.settlement import (
+    enqueue_settlement, wake_settlement_workers, start_settlement_workers, settlements_needing_review,
+    resolve_settlement
 )
-from algosdk import mnemonic as algo_mnemonic
-from services.valuation import compute_token_price_scaled_gbp
 
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.environ.get("SECRET_KEY", "dev_secret")
     init_db()
+    init_db_app(app)
+    init_metrics_app(app)
 
     def login_required(role=None):
         def deco(f):
@@ -56,22 +77,23 @@ def create_app():
             home_address = request.form.get("home_address","").strip()
             linkedin_url = request.form.get("linkedin_url","").strip() if role == "developer" else None
 
-            sk, addr, mnem = generate_wallet()
+            # Hashed before claim_wallet opens the write transaction, so the slow hash holds no lock.
+            password_hash = generate_password_hash(password)
             conn = db()
             try:
-                conn.execute(
+                addr, mnem, prefunded = claim_wallet(conn)
+                cur = conn.execute(
                     "INSERT INTO users(email,password_hash,role,first_name,last_name,home_address,linkedin_url,algo_addr,algo_mnemonic) VALUES(?,?,?,?,?,?,?,?,?)",
-                    (email, generate_password_hash(password), role, first_name, last_name, home_address, linkedin_url, addr, mnem)
+                    (email, password_hash, role, first_name, last_name, home_address, linkedin_url, addr, mnem)
                 )
+                conn.execute("INSERT INTO dashboard_summaries(user_id) VALUES(?)", (cur.lastrowid,))
                 conn.commit()
-                try:
-                    fund_account(addr, 10_000_000)
-                except Exception as fe:
-                    print("Funding warning:", fe)
+                if not prefunded:
+                    fund_claimed_wallets_async()
 
                 if role == "company":
                     uid = conn.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()["id"]
-                    existing = conn.execute("SELECT id FROM companies WHERE user_id=?", (uid,)).fetchone()
+                    existing = company_for_user(conn, uid)
                     if not existing:
                         conn.execute("""
                             INSERT INTO companies(user_id,name,asset_id,app_id,unit_name,asset_name,supply,equity_pct,valuation_gbp)
@@ -82,6 +104,7 @@ def create_app():
                 flash("Registered. Please sign in.")
                 return redirect(url_for("login"))
             except Exception as e:
+                count_swallowed("register", e)
                 print("Registration error:", e)
                 if "UNIQUE constraint failed: users.email" in str(e):
                     flash("Registration failed: email already registered.")
@@ -104,7 +127,7 @@ def create_app():
                 session["role"]   = user["role"]
                 if user["role"] == "company":
                     conn2 = db()
-                    comp = conn2.execute("SELECT * FROM companies WHERE user_id=?", (user["id"],)).fetchone()
+                    comp = company_for_user(conn2, user["id"])
                     conn2.close()
                     if comp and (not comp["name"] or comp["asset_id"] is None or comp["app_id"] is None):
                         return redirect(url_for("company_setup"))
@@ -124,66 +147,44 @@ def create_app():
         conn = db()
         user = conn.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
         if session["role"] == "company":
-            comp = conn.execute("SELECT * FROM companies WHERE user_id=?", (user["id"],)).fetchone()
+            comp = company_for_user(conn, user["id"])
             if comp and (not comp["name"] or comp["asset_id"] is None or comp["app_id"] is None):
                 conn.close()
                 return redirect(url_for("company_setup"))
-            jobs = conn.execute(
-                "SELECT * FROM jobs WHERE company_id=? ORDER BY created_at DESC",
-                (comp["id"],)
-            ).fetchall() if comp and comp["name"] else []
+            jobs, next_cursor = [], None
+            if comp and comp["name"]:
+                jobs, next_cursor = company_jobs_page(conn, comp["id"], request.args.get("cursor"))
+            summary = dashboard_summary(conn, user["id"])
             state = {}
-            if comp and comp["app_id"]:
-                try:
-                    state = get_app_state(comp["app_id"])
-                    if "token_price" in state:
-                        state["token_price_human_gbp"] = state["token_price"]/SCALE_GBP
-                except Exception:
-                    state = {}
+            if comp and comp["app_id"] and summary["price_scaled"] is not None:
+                state = dict(token_id=comp["asset_id"], token_price=summary["price_scaled"],
+                             token_price_human_gbp=summary["price_scaled"]/SCALE_GBP)
             conn.close()
-            return render_template("company_dashboard.html", user=user, company=comp, jobs=jobs, state=state)
+            return render_template("company_dashboard.html", user=user, company=comp, jobs=jobs, state=state,
+                                   next_cursor=next_cursor, cursor=request.args.get("cursor"),
+                                   summary=summary, last_event_id=last_event_id())
         else:
-            holdings = conn.execute("""
-                SELECT dh.*, c.name AS company_name, c.app_id
-                FROM developer_holdings dh
-                JOIN companies c ON c.id = dh.company_id
-                WHERE dh.developer_id=?
-            """, (user["id"],)).fetchall()
-            holdings_view = []
-            for h in holdings:
-                price_scaled = 0
-                if h["app_id"]:
-                    try:
-                        st = get_app_state(h["app_id"])
-                        price_scaled = st.get("token_price", 0)
-                    except Exception:
-                        price_scaled = 0
-                value_gbp = (price_scaled / SCALE_GBP) * h["tokens_held"]
-                holdings_view.append(dict(
-                    company_name=h["company_name"],
-                    tokens=h["tokens_held"],
-                    price_gbp=price_scaled / SCALE_GBP,
-                    value_gbp=value_gbp
-                ))
-            open_jobs = conn.execute("""
-                SELECT j.*, c.name AS company_name, c.supply AS company_supply
-                FROM jobs j JOIN companies c ON j.company_id=c.id
-                WHERE j.status='open'
-                ORDER BY j.created_at DESC
-            """).fetchall()
-            my_current = conn.execute("""
-                SELECT j.*, c.name AS company_name, c.supply AS company_supply
-                FROM jobs j JOIN companies c ON j.company_id=c.id
-                WHERE j.developer_id=? AND j.status IN ('picked','awaiting_verification')
-                ORDER BY j.created_at DESC
-            """, (user["id"],)).fetchall()
+            summary = dashboard_summary(conn, user["id"])
+            holdings_view = [dict(
+                company_id=h["company_id"],
+                company_name=h["company_name"],
+                app_id=h["app_id"],
+                tokens=h["tokens"],
+                price_gbp=h["price_scaled"] / SCALE_GBP,
+                value_gbp=h["tokens"] * h["price_scaled"] / SCALE_GBP
+            ) for h in summary["holdings"]]
+            open_jobs, next_cursor = open_jobs_page(conn)
+            my_current = developer_current_jobs(conn, user["id"])
             conn.close()
             return render_template(
                 "developer_dashboard.html",
                 user=user,
                 open_jobs=open_jobs,
+                next_cursor=next_cursor,
                 my_current=my_current,
-                holdings=holdings_view
+                holdings=holdings_view,
+                summary=summary,
+                last_event_id=last_event_id()
             )
 
     @app.route("/company/setup", methods=["GET","POST"])
@@ -191,7 +192,7 @@ def create_app():
     def company_setup():
         conn = db()
         user = conn.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
-        comp = conn.execute("SELECT * FROM companies WHERE user_id=?", (user["id"],)).fetchone()
+        comp = company_for_user(conn, user["id"])
 
         if comp and comp["name"] and comp["asset_id"] is not None and comp["app_id"] is not None:
             conn.close()
@@ -199,37 +200,52 @@ def create_app():
             return redirect(url_for("dashboard"))
 
         if request.method == "POST":
-            name   = request.form["name"].strip()
-            supply = int(request.form["supply"])
-            equity = float(request.form.get("equity_pct", "15"))/100.0
-            valuation_gbp = float(request.form.get("valuation_gbp", "1000000"))
-
-            unit_name = ''.join(filter(str.isalpha, name.upper()))[:5]
-            asset_name = f"{name} Token"
-
-            company_sk = algo_mnemonic.to_private_key(user["algo_mnemonic"])
-
-            asset_id = create_asa(company_sk, unit_name, asset_name, supply, decimals=0)
-            initial_price_scaled = compute_token_price_scaled_gbp(name, supply, equity, valuation_override_gbp=valuation_gbp)
-            app_id = deploy_price_app(company_sk, asset_id, initial_price_scaled)
-
-            conn.execute("""
-                UPDATE companies
-                SET name=?, asset_id=?, app_id=?, unit_name=?, asset_name=?, supply=?, equity_pct=?, valuation_gbp=?
-                WHERE id=?
-            """, (name, asset_id, app_id, unit_name, asset_name, supply, equity, valuation_gbp, comp["id"]))
+            if comp["asset_txid"] is None and comp["asset_id"] is None:
+                name   = request.form["name"].strip()
+                supply = int(request.form["supply"])
+                equity = float(request.form.get("equity_pct", "15"))/100.0
+                valuation_gbp = float(request.form.get("valuation_gbp", "1000000"))
+
+                unit_name = ''.join(filter(str.isalpha, name.upper()))[:5]
+                asset_name = f"{name} Token"
+
+                conn.execute("""
+                    UPDATE companies
+                    SET name=?, unit_name=?, asset_name=?, supply=?, equity_pct=?, valuation_gbp=?,
+                        onboarding_status='queued', onboarding_error=NULL, onboarding_updated_at=CURRENT_TIMESTAMP
+                    WHERE id=? AND asset_txid IS NULL AND asset_id IS NULL
+                """, (name, unit_name, asset_name, supply, equity, valuation_gbp, comp["id"]))
+            else:
+                # The token is already on its way; a retry resumes with the stored configuration.
+                conn.execute("""
+                    UPDATE companies SET onboarding_status=COALESCE(NULLIF(onboarding_status, 'failed'), 'queued'),
+                      onboarding_error=NULL, onboarding_updated_at=CURRENT_TIMESTAMP
+                    WHERE id=?
+                """, (comp["id"],))
             conn.commit()
             conn.close()
-            flash("Company setup completed. Configuration is now locked.")
-            return redirect(url_for("dashboard"))
+            start_onboarding(comp["id"])
+            return redirect(url_for("company_setup"))
         conn.close()
-        return render_template("company_setup.html", onboarding=False, company=comp)
+        onboarding = comp["onboarding_status"] in IN_PROGRESS_STATUSES if comp else False
+        return render_template("company_setup.html", onboarding=onboarding, company=comp)
+
+    @app.route("/company/setup/status")
+    @login_required(role="company")
+    def company_setup_status():
+        conn = db()
+        comp = company_for_user(conn, session["user_id"])
+        conn.close()
+        status = onboarding_status(comp["id"]) if comp else None
+        if status is None:
+            return jsonify(error="No company for this account."), 404
+        return jsonify(status)
 
     @app.route("/company/jobs/new", methods=["GET","POST"])
     @login_required(role="company")
     def new_job():
         conn = db()
-        comp = conn.execute("SELECT * FROM companies WHERE user_id=?", (session["user_id"],)).fetchone()
+        comp = company_for_user(conn, session["user_id"])
         if not comp or comp["asset_id"] is None or comp["app_id"] is None or not comp["name"]:
             conn.close()
             flash("Complete company setup first.")
@@ -239,10 +255,11 @@ def create_app():
             desc  = request.form["description"].strip()
             upfront_gbp_pence = int(round(float(request.form["upfront_gbp"]) * 100))
             token_amount  = int(request.form["token_amount"])
-            conn.execute("""
+            cur = conn.execute("""
                 INSERT INTO jobs(company_id,title,description,upfront_gbp_pence,token_amount)
                 VALUES(?,?,?,?,?)
             """, (comp["id"], title, desc, upfront_gbp_pence, token_amount))
+            record_job_transition(conn, cur.lastrowid, None, "open")
             conn.commit()
             conn.close()
             flash("Task created.")
@@ -250,17 +267,76 @@ def create_app():
         conn.close()
         return render_template("new_job.html")
 
+    @app.route("/company/jobs/import", methods=["GET","POST"])
+    @login_required(role="company")
+    def bulk_import_jobs():
+        # Accepts a multipart "file" upload from the form, or a raw CSV / JSON lines request body.
+        wants_json = request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+        conn = db()
+        comp = company_for_user(conn, session["user_id"])
+        if not comp or comp["asset_id"] is None or comp["app_id"] is None or not comp["name"]:
+            conn.close()
+            if wants_json:
+                return jsonify(error="Complete company setup first."), 409
+            flash("Complete company setup first.")
+            return redirect(url_for("company_setup"))
+        if request.method == "GET":
+            conn.close()
+            return render_template("import_jobs.html", result=None)
+
+        upload = request.files.get("file")
+        if upload is not None and upload.filename:
+            fmt = detect_format(upload.filename, upload.mimetype, request.form.get("format"))
+            stream = upload.stream
+        elif upload is None and request.mimetype not in ("multipart/form-data", "application/x-www-form-urlencoded"):
+            fmt = detect_format(None, request.mimetype, request.args.get("format"))
+            stream = request.stream
+        else:
+            conn.close()
+            if wants_json:
+                return jsonify(error="Upload a CSV or JSON lines file."), 400
+            flash("Choose a CSV or JSON lines file to import.")
+            return redirect(url_for("bulk_import_jobs"))
+        result = import_jobs(conn, comp["id"], session["user_id"], iter_rows(stream, fmt))
+        conn.close()
+        if wants_json:
+            return jsonify(result)
+        return render_template("import_jobs.html", result=result)
+
     @app.route("/jobs")
     @login_required(role="developer")
     def browse_jobs():
+        def int_arg(name):
+            try:
+                return int(request.args[name])
+            except (KeyError, ValueError):
+                return None
+        def pence_arg(name):
+            try:
+                return int(round(float(request.args[name]) * 100))
+            except (KeyError, ValueError):
+                return None
+
         conn = db()
-        jobs = conn.execute("""
-            SELECT j.*, c.name AS company_name
-            FROM jobs j JOIN companies c ON j.company_id=c.id
-            WHERE j.status='open' ORDER BY j.created_at DESC
-        """).fetchall()
+        jobs, next_cursor = open_jobs_page(
+            conn, request.args.get("cursor"), limit=int_arg("limit") or JOBS_PAGE_SIZE,
+            company_id=int_arg("company"),
+            min_tokens=int_arg("min_tokens"), max_tokens=int_arg("max_tokens"),
+            min_upfront_pence=pence_arg("min_upfront"), max_upfront_pence=pence_arg("max_upfront"),
+        )
+        companies = company_choices(conn)
+        conn.close()
+        filters = {k: v for k, v in request.args.items() if k != "cursor" and v != ""}
+        return render_template("jobs.html", jobs=jobs, next_cursor=next_cursor, filters=filters, companies=companies)
+
+    @app.route("/jobs/search")
+    @login_required(role="developer")
+    def search_jobs():
+        q = request.args.get("q", "").strip()
+        conn = db()
+        results = search_open_jobs(conn, q) if q else []
         conn.close()
-        return render_template("jobs.html", jobs=jobs)
+        return render_template("job_search.html", q=q, results=results)
 
     @app.route("/jobs/<int:job_id>")
     @login_required(role="developer")
@@ -285,9 +361,16 @@ def create_app():
             conn.close()
             flash("Task not available to pick up.")
             return redirect(url_for("dashboard"))
-        conn.execute("UPDATE jobs SET developer_id=?, status='picked' WHERE id=?", (session["user_id"], job_id))
+        cur = conn.execute("UPDATE jobs SET developer_id=?, status='picked' WHERE id=? AND status='open'",
+                           (session["user_id"], job_id))
+        if cur.rowcount != 1:
+            conn.close()
+            flash("Task not available to pick up.")
+            return redirect(url_for("dashboard"))
+        record_job_transition(conn, job_id, "open", "picked")
         conn.commit()
         conn.close()
+        opt_in_for_job_async(job_id)
         flash("Task added to your current list.")
         return redirect(url_for("dashboard"))
 
@@ -300,7 +383,11 @@ def create_app():
             conn.close()
             flash("Cannot mark this task as completed.")
             return redirect(url_for("dashboard"))
-        conn.execute("UPDATE jobs SET developer_marked_complete=1, status='awaiting_verification' WHERE id=?", (job_id,))
+        cur = conn.execute("""
+            UPDATE jobs SET developer_marked_complete=1, status='awaiting_verification' WHERE id=? AND status='picked'
+        """, (job_id,))
+        if cur.rowcount == 1:
+            record_job_transition(conn, job_id, "picked", "awaiting_verification")
         conn.commit()
         conn.close()
         flash("Task marked completed. Awaiting company verification.")
@@ -311,7 +398,7 @@ def create_app():
     def verify_job(job_id):
         conn = db()
         company_user = conn.execute("SELECT * FROM users WHERE id=?", (session["user_id"],)).fetchone()
-        comp = conn.execute("SELECT * FROM companies WHERE user_id=?", (company_user["id"],)).fetchone()
+        comp = company_for_user(conn, company_user["id"])
         job  = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
         dev  = conn.execute("SELECT * FROM users WHERE id=?", (job["developer_id"],)).fetchone()
         if not (comp and job and dev) or job["status"] != "awaiting_verification":
@@ -319,69 +406,175 @@ def create_app():
             flash("Invalid task state for verification.")
             return redirect(url_for("dashboard"))
 
-        company_sk   = algo_mnemonic.to_private_key(company_user["algo_mnemonic"])
-        company_addr = company_user["algo_addr"]
-        dev_addr     = dev["algo_addr"]
-
-        try:
-            ensure_opt_in(algo_mnemonic.to_private_key(dev["algo_mnemonic"]), comp["asset_id"])
-        except Exception:
-            pass
-
-        new_price_scaled = compute_token_price_scaled_gbp(
-            comp["name"], comp["supply"], comp["equity_pct"], valuation_override_gbp=comp["valuation_gbp"]
-        )
-        upfront_microalgos = 500_000 
-
-        try:
-            atomic_approve_and_pay(
-                company_sk, company_addr, dev_addr, comp["app_id"], comp["asset_id"],
-                upfront_microalgos, job["token_amount"], new_price_scaled
-            )
-        except Exception as e:
+        if not enqueue_settlement(conn, job_id, comp["id"]):
             conn.close()
-            flash(f"Settlement failed: {e}")
+            flash("Invalid task state for verification.")
             return redirect(url_for("dashboard"))
+        conn.commit()
+        conn.close()
+        wake_settlement_workers()
+        flash("Task verified. Settlement is in progress.")
+        return redirect(url_for("dashboard"))
 
-        existing = conn.execute("""
-            SELECT * FROM developer_holdings WHERE developer_id=? AND company_id=? AND asset_id=?
-        """, (dev["id"], comp["id"], comp["asset_id"])).fetchone()
-        if existing:
-            conn.execute("UPDATE developer_holdings SET tokens_held=tokens_held+?, updated_at=CURRENT_TIMESTAMP WHERE id=?",
-                         (job["token_amount"], existing["id"]))
-        else:
-            conn.execute("""
-                INSERT INTO developer_holdings(developer_id, company_id, asset_id, tokens_held)
-                VALUES(?,?,?,?)
-            """, (dev["id"], comp["id"], comp["asset_id"], job["token_amount"]))
-
-        conn.execute("UPDATE jobs SET status='closed' WHERE id=?", (job_id,))
+    @app.route("/company/jobs/verify", methods=["POST"])
+    @login_required(role="company")
+    def verify_jobs_bulk():
+        job_ids = [int(j) for j in request.form.getlist("job_ids") if j.isdigit()]
+        conn = db()
+        comp = company_for_user(conn, session["user_id"])
+        if not comp or not job_ids:
+            conn.close()
+            flash("Select at least one task to verify.")
+            return redirect(url_for("dashboard"))
+        queued = sum(1 for job_id in job_ids if enqueue_settlement(conn, job_id, comp["id"]))
         conn.commit()
         conn.close()
-        flash("Task verified and settled. Developer paid and tokens transferred.")
+        wake_settlement_workers()
+        skipped = len(job_ids) - queued
+        flash(f"{queued} task(s) verified. Settlement is in progress."
+              + (f" {skipped} task(s) were not awaiting verification." if skipped else ""))
         return redirect(url_for("dashboard"))
 
-    def refresh_all_prices():
+    PRICE_HISTORY_RANGES = {"1d": 86400, "7d": 7 * 86400, "30d": 30 * 86400, "1y": 365 * 86400}
+
+    @app.route("/prices/<int:app_id>/history")
+    @login_required()
+    def price_history(app_id):
+        end_ts = int(time.time())
+        range_ = request.args.get("range", "7d")
+        conn = db()
+        if range_ == "all":
+            first = first_price_ts(conn, app_id)
+            start_ts = first if first is not None else end_ts - PRICE_HISTORY_RANGES["7d"]
+        else:
+            start_ts = end_ts - PRICE_HISTORY_RANGES.get(range_, PRICE_HISTORY_RANGES["7d"])
         try:
-            conn = db()
-            companies = conn.execute("SELECT * FROM companies WHERE app_id IS NOT NULL AND name <> ''").fetchall()
-            for comp in companies:
-                user = conn.execute("SELECT * FROM users WHERE id=?", (comp["user_id"],)).fetchone()
-                company_sk = algo_mnemonic.to_private_key(user["algo_mnemonic"])
-                new_price_scaled = compute_token_price_scaled_gbp(
-                    comp["name"], comp["supply"], comp["equity_pct"], valuation_override_gbp=comp["valuation_gbp"]
-                )
-                try:
-                    update_token_price(company_sk, comp["app_id"], new_price_scaled)
-                except Exception:
-                    pass
-            conn.close()
-        except Exception:
-            pass
+            points = int(request.args.get("points", "120"))
+        except ValueError:
+            points = 120
+        series = price_history_series(conn, app_id, start_ts, end_ts, points)
+        conn.close()
+        return jsonify(app_id=app_id, start=start_ts, end=end_ts, series=series)
 
-    scheduler = BackgroundScheduler(daemon=True)
-    scheduler.add_job(refresh_all_prices, "interval", minutes=5, id="price_updater", replace_existing=True)
-    scheduler.start()
+    @app.route("/events")
+    @login_required()
+    def events():
+        # Server-sent events for the dashboards; EventSource resends the last id it saw when it reconnects.
+        user_id = session["user_id"]
+        try:
+            last_id = int(request.headers.get("Last-Event-ID") or request.args["last_id"])
+        except (KeyError, ValueError):
+            last_id = None
+
+        def stream():
+            yield "retry: 3000\n\n"
+            for item in event_bus.listen(user_id, last_id):
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id, event, payload = item
+                yield (f"id: {event_id}\n" if event_id is not None else "") + f"event: {event}\ndata: {payload}\n\n"
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    # Off unless VENTRY_INTERNAL_STATS=1, and then only for signed-in users.
+    @app.route("/internal/stats")
+    @login_required()
+    def internal_stats():
+        if os.environ.get("VENTRY_INTERNAL_STATS", "0") != "1":
+            abort(404)
+        return jsonify(algod=algod_transport_stats(), app_state=app_state_fetch_stats(),
+                       confirmations=confirmation_stats(), suggested_params=suggested_params_stats(),
+                       wallet_pool=wallet_pool_stats(), opt_ins=opt_in_stats(), signers=signer_cache_stats(),
+                       events=event_stats())
+
+    # Off unless METRICS_TOKEN is set, and then only for requests carrying it as a bearer token.
+    @app.route("/metrics")
+    def metrics():
+        if not METRICS_TOKEN:
+            abort(404)
+        if not metrics_authorized(request.headers.get("Authorization")):
+            return Response("Unauthorized\n", 401, {"WWW-Authenticate": "Bearer"}, mimetype="text/plain")
+        return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    for name, collect in (("app_state", app_state_fetch_stats), ("confirmations", confirmation_stats),
+                          ("suggested_params", suggested_params_stats), ("wallet_pool", wallet_pool_stats),
+                          ("opt_ins", opt_in_stats), ("signers", signer_cache_stats),
+                          ("algod_transport", algod_transport_stats), ("events", event_stats)):
+        register_collector(name, collect)
+
+    if os.environ.get("VENTRY_RUN_SCHEDULER", "1") != "0":
+        add_periodic_jobs(BackgroundScheduler(daemon=True)).start()
+    start_settlement_workers()
+
+    def warm_programs():
+        try:
+            warm_program_cache()
+        except Exception as e:
+            count_swallowed("teal_warmup", e)
+            print("TEAL warm-up warning:", e)
+    threading.Thread(target=warm_programs, name="teal-warmup", daemon=True).start()
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans_command():
+        """Fail if any hot route or worker query scans a whole table or sorts in a temp b-tree."""
+        conn = db()
+        offenders = check_query_plans(conn)
+        conn.close()
+        for name, steps in offenders.items():
+            print(f"{name}: {'; '.join(steps)}")
+        if offenders:
+            raise SystemExit(1)
+        print("All hot queries are served from an index.")
+
+    @app.cli.command("rebuild-dashboards")
+    @click.option("--check", is_flag=True, help="Only report differences; leave the stored summaries alone.")
+    def rebuild_dashboards_command(check):
+        """Recompute every dashboard summary from the jobs, holdings and price tables."""
+        conn = db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            differences = rebuild_dashboard_summaries(conn, check_only=check)
+            conn.commit()
+        finally:
+            conn.close()
+        for user_id, field, stored, expected in differences:
+            print(f"user {user_id}: {field} is {stored!r}, expected {expected!r}")
+        if check:
+            if differences:
+                raise SystemExit(1)
+            print("Dashboard summaries are consistent.")
+        else:
+            print(f"Dashboard summaries rebuilt; {len(differences)} difference(s) corrected.")
+
+    @app.cli.command("review-settlements")
+    def review_settlements_command():
+        """List settlements held for review because their payout may or may not be on chain."""
+        rows = settlements_needing_review()
+        for s in rows:
+            window = f"rounds {s['first_valid']}-{s['last_valid']}" if s["last_valid"] else "no recorded window"
+            print(f"settlement {s['id']} (job {s['job_id']}): txid {s['txid']}, {window}; {s['last_error']}")
+        if not rows:
+            print("No settlements are held for review.")
+
+    @app.cli.command("resolve-settlement")
+    @click.argument("settlement_id", type=int)
+    @click.option("--confirmed-round", type=int, help="Round the group confirmed in; the job is closed.")
+    @click.option("--not-on-chain", is_flag=True, help="The group never confirmed; the job can be verified again.")
+    def resolve_settlement_command(settlement_id, confirmed_round, not_on_chain):
+        """Resolve a held settlement after checking its txid on chain."""
+        if (confirmed_round is None) == (not not_on_chain):
+            raise click.UsageError("Pass exactly one of --confirmed-round or --not-on-chain.")
+        if not resolve_settlement(settlement_id, confirmed_round):
+            raise click.ClickException(f"Settlement {settlement_id} is not held for review.")
+        print("Settlement closed." if confirmed_round is not None else "Task handed back for verification.")
+
+    @app.cli.command("warm-teal")
+    def warm_teal_command():
+        """Compile the price app programs into the TEAL cache ahead of time."""
+        warm_program_cache()
+        print("TEAL programs cached.")
 
     return app
 
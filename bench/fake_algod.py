@@ -0,0 +1,200 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+from algosdk import transaction
+
+# An in-process stand-in for the algod endpoints services/algorand.py uses. Every pending
+# transaction confirms at the next round; nothing is validated beyond decoding.
+
+class FakeLedger:
+    def __init__(self, round_time: float = 0.2):
+        self.round_time = round_time
+        self.round = 1000
+        self.cond = threading.Condition()
+        self.pending = []
+        self.txns = {}
+        self.blocks = {}
+        self.assets = {}
+        self.apps = {}
+        self.opt_ins = set()
+        self.next_index = 1000
+        self.counts = {}
+        self._stopped = threading.Event()
+
+    def count(self, key: str):
+        with self.cond:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def tick_forever(self):
+        while not self._stopped.wait(self.round_time):
+            with self.cond:
+                self.round += 1
+                ids = []
+                for txid, stxn in self.pending:
+                    info = self.txns[txid]
+                    info["confirmed-round"] = self.round
+                    self._apply(stxn.transaction, info)
+                    ids.append(txid)
+                self.pending = []
+                self.blocks[self.round] = ids
+                self.cond.notify_all()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _apply(self, txn, info):
+        if isinstance(txn, transaction.AssetConfigTxn) and not txn.index:
+            self.next_index += 1
+            info["asset-index"] = self.next_index
+            self.assets[self.next_index] = {"creator": txn.sender, "unit-name": txn.unit_name, "name": txn.asset_name,
+                                            "total": txn.total}
+        elif isinstance(txn, transaction.ApplicationCallTxn):
+            args = txn.app_args or []
+            if not txn.index:
+                self.next_index += 1
+                info["application-index"] = self.next_index
+                self.apps[self.next_index] = {
+                    "creator": txn.sender,
+                    "state": {
+                        "token_id": int.from_bytes(args[1], "big"),
+                        "token_price": int.from_bytes(args[2], "big"),
+                        "company_addr": txn.sender,
+                    },
+                }
+            elif args and args[0] == b"update_token_price" and txn.index in self.apps:
+                self.apps[txn.index]["state"]["token_price"] = int.from_bytes(args[1], "big")
+        elif isinstance(txn, transaction.AssetTransferTxn):
+            if txn.amount == 0 and txn.receiver == txn.sender:
+                self.opt_ins.add((txn.sender, txn.index))
+
+    def submit(self, raw: bytes) -> str:
+        ids = []
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(raw)
+        with self.cond:
+            for d in unpacker:
+                stxn = transaction.SignedTransaction.undictify(d)
+                txid = stxn.transaction.get_txid()
+                self.txns[txid] = {"confirmed-round": 0, "pool-error": ""}
+                self.pending.append((txid, stxn))
+                ids.append(txid)
+        return ids[0]
+
+    def global_state(self, app_id: int):
+        out = []
+        for k, v in self.apps[app_id]["state"].items():
+            key = base64.b64encode(k.encode()).decode()
+            if isinstance(v, int):
+                out.append({"key": key, "value": {"type": 2, "uint": v}})
+            else:
+                out.append({"key": key, "value": {"type": 1, "bytes": base64.b64encode(v.encode()).decode()}})
+        return out
+
+    def account(self, addr: str):
+        return {
+            "address": addr,
+            "created-assets": [{"index": i, "params": {k: v for k, v in a.items() if k != "creator"}}
+                               for i, a in self.assets.items() if a["creator"] == addr],
+            "created-apps": [{"id": i, "params": {"global-state": self.global_state(i)}}
+                             for i, a in self.apps.items() if a["creator"] == addr],
+        }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ledger: FakeLedger = None
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, obj, code: int = 200):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        ledger = self.ledger
+        path = self.path.split("?")[0]
+        if path == "/versions":
+            ledger.count("versions")
+            return self._json({"build": {"major": 3, "minor": 0, "build_number": 1, "commit_hash": "fake"},
+                               "genesis_id": "fake-v1", "versions": ["v2"]})
+        if path == "/v2/transactions/params":
+            ledger.count("params")
+            return self._json({"fee": 0, "last-round": ledger.round, "genesis-id": "fake-v1",
+                               "genesis-hash": base64.b64encode(b"\0" * 32).decode(),
+                               "consensus-version": "future", "min-fee": 1000})
+        if path == "/v2/status":
+            ledger.count("status")
+            return self._json({"last-round": ledger.round})
+        m = re.match(r"/v2/status/wait-for-block-after/(\d+)$", path)
+        if m:
+            ledger.count("wait_for_block")
+            after = int(m.group(1))
+            with ledger.cond:
+                ledger.cond.wait_for(lambda: ledger.round > after, timeout=max(ledger.round_time * 5, 1))
+                return self._json({"last-round": ledger.round})
+        m = re.match(r"/v2/transactions/pending/(\w+)$", path)
+        if m:
+            ledger.count("pending_info")
+            info = ledger.txns.get(m.group(1))
+            if info is None:
+                return self._json({"message": "txn not found"}, 404)
+            return self._json(info)
+        m = re.match(r"/v2/blocks/(\d+)/txids$", path)
+        if m:
+            ledger.count("block_txids")
+            return self._json({"blockTxids": ledger.blocks.get(int(m.group(1)), [])})
+        m = re.match(r"/v2/applications/(\d+)$", path)
+        if m:
+            ledger.count("application_info")
+            app_id = int(m.group(1))
+            if app_id not in ledger.apps:
+                return self._json({"message": "application does not exist"}, 404)
+            return self._json({"id": app_id, "params": {"global-state": ledger.global_state(app_id)}})
+        m = re.match(r"/v2/accounts/(\w+)/assets/(\d+)$", path)
+        if m:
+            ledger.count("account_asset_info")
+            if (m.group(1), int(m.group(2))) in ledger.opt_ins:
+                return self._json({"asset-holding": {"amount": 0, "asset-id": int(m.group(2))}})
+            return self._json({"message": "account asset information not found"}, 404)
+        m = re.match(r"/v2/accounts/(\w+)$", path)
+        if m:
+            ledger.count("account_info")
+            return self._json(ledger.account(m.group(1)))
+        return self._json({"message": "not found"}, 404)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?")[0]
+        if path == "/v2/transactions":
+            self.ledger.count("send")
+            try:
+                return self._json({"txId": self.ledger.submit(body)})
+            except Exception as e:
+                return self._json({"message": str(e)}, 400)
+        if path == "/v2/teal/compile":
+            self.ledger.count("compile")
+            return self._json({"hash": "fake", "result": base64.b64encode(hashlib.sha256(body).digest()).decode()})
+        return self._json({"message": "not found"}, 404)
+
+def serve(port: int = 0, round_time: float = 0.2, latency: float = 0.0):
+    # Returns the running server and its ledger; the address is http://127.0.0.1:<server.server_port>.
+    ledger = FakeLedger(round_time)
+    handler = type("FakeAlgodHandler", (Handler,), {"ledger": ledger, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-algod", daemon=True).start()
+    threading.Thread(target=ledger.tick_forever, name="fake-algod-rounds", daemon=True).start()
+    return server, ledger
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_algod import serve
+
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(
+        description="Drive register -> company_setup -> new_job -> pickup -> complete -> verify against a fake algod."
+    )
+    p.add_argument("--companies", type=int, default=4)
+    p.add_argument("--developers", type=int, default=4, help="developers per company")
+    p.add_argument("--jobs", type=int, default=16, help="jobs per company")
+    p.add_argument("--concurrency", type=int, default=16, help="simulated users acting at once")
+    p.add_argument("--round-time", type=float, default=0.25, help="fake algod seconds per round")
+    p.add_argument("--latency", type=float, default=0.002, help="fake algod seconds added to every call")
+    p.add_argument("--cold-wallets", action="store_true", help="start with an empty wallet pool")
+    p.add_argument("--settle-timeout", type=float, default=120)
+    p.add_argument("--output", help="results file (default: bench/results/<time>-<commit>.json)")
+    p.add_argument("--compare", help="earlier results file to print p95 and throughput deltas against")
+    return p.parse_args(argv)
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def call(self, label: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        resp = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(label, []).append(elapsed)
+            if resp.status_code >= 400:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return resp
+
+    def summary(self):
+        out = {}
+        for label, values in sorted(self.samples.items()):
+            values = sorted(values)
+            out[label] = dict(
+                count=len(values), errors=self.errors.get(label, 0),
+                mean_ms=round(sum(values) / len(values) * 1000, 3),
+                p50_ms=round(percentile(values, 50) * 1000, 3),
+                p95_ms=round(percentile(values, 95) * 1000, 3),
+                p99_ms=round(percentile(values, 99) * 1000, 3),
+                max_ms=round(values[-1] * 1000, 3),
+            )
+        return out
+
+def percentile(sorted_values, pct: float) -> float:
+    # Nearest-rank percentile.
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    # The app's pooled connections still hold the database open when this exits; removing it is fine on POSIX.
+    with tempfile.TemporaryDirectory(prefix="ventry-bench-", ignore_cleanup_errors=True) as workdir:
+        return _run(args, workdir)
+
+def _run(args, workdir: str):
+    server, ledger = serve(0, args.round_time, args.latency)
+    users = args.companies * (args.developers + 1)
+    # Configuration is read at import time, so it has to be in place before the app is imported.
+    os.environ.update({
+        "ALGOD_ADDRESSES": f"http://127.0.0.1:{server.server_port}",
+        "ALGOD_ROUND_SECONDS": str(args.round_time),
+        "VENTRY_DB_PATH": os.path.join(workdir, "bench.db"),
+        "TEAL_CACHE_DIR": os.path.join(workdir, "teal"),
+        "VENTRY_RUN_SCHEDULER": "0",
+        "WALLET_POOL_TARGET": str(0 if args.cold_wallets else users),
+    })
+    from app import create_app
+    from models import db
+    from services.wallet_pool import refill_wallet_pool
+
+    app = create_app()
+    app.config["TESTING"] = True
+    if not args.cold_wallets:
+        refill_wallet_pool()
+    rec = Recorder()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench-user")
+    flow_started = time.perf_counter()
+
+    def sign_up(email, role):
+        client = app.test_client()
+        rec.call("POST /register", client.post, "/register",
+                 data=dict(email=email, password="bench", role=role, first_name="Bench", last_name="User"))
+        rec.call("POST /login", client.post, "/login", data=dict(email=email, password="bench"))
+        return client
+
+    def onboard_company(n):
+        client = sign_up(f"company{n}@bench.local", "company")
+        rec.call("POST /company/setup", client.post, "/company/setup",
+                 data=dict(name=f"Bench Co {n}", supply="1000000", equity_pct="15", valuation_gbp="1000000"))
+        while True:
+            status = rec.call("GET /company/setup/status", client.get, "/company/setup/status").get_json()
+            if status["done"] or status["status"] == "failed":
+                break
+            time.sleep(args.round_time / 2)
+        for j in range(args.jobs):
+            rec.call("POST /company/jobs/new", client.post, "/company/jobs/new",
+                     data=dict(title=f"Task {j} for company {n}", description="Benchmark task",
+                               upfront_gbp="5", token_amount="10"))
+        rec.call("GET /dashboard (company)", client.get, "/dashboard")
+        conn = db()
+        company_id = conn.execute("SELECT c.id FROM companies c JOIN users u ON u.id = c.user_id WHERE u.email=?",
+                                  (f"company{n}@bench.local",)).fetchone()["id"]
+        conn.close()
+        return client, status, company_id
+
+    def developer_flow(client, company_id, job_ids):
+        rec.call("GET /dashboard (developer)", client.get, "/dashboard")
+        rec.call("GET /jobs", client.get, f"/jobs?company={company_id}")
+        for job_id in job_ids:
+            rec.call("POST /jobs/<id>/pickup", client.post, f"/jobs/{job_id}/pickup")
+        for job_id in job_ids:
+            rec.call("POST /jobs/<id>/complete", client.post, f"/jobs/{job_id}/complete")
+
+    companies = list(pool.map(onboard_company, range(args.companies)))
+    developers = list(pool.map(lambda n: sign_up(f"dev{n}@bench.local", "developer"),
+                               range(args.companies * args.developers)))
+    failed_onboarding = sum(1 for _, status, _ in companies if not status["done"])
+
+    conn = db()
+    company_jobs = {}
+    for row in conn.execute("SELECT company_id, id FROM jobs ORDER BY company_id, id").fetchall():
+        company_jobs.setdefault(row["company_id"], []).append(row["id"])
+    conn.close()
+
+    # Each company's jobs are split between its own developers, so pickups never collide.
+    work = []
+    for n, (_, _, company_id) in enumerate(companies):
+        for d in range(args.developers):
+            client = developers[n * args.developers + d]
+            work.append((client, company_id, company_jobs.get(company_id, [])[d::args.developers]))
+    list(pool.map(lambda w: developer_flow(*w), work))
+
+    def verify_all(company):
+        client, _, company_id = company
+        for job_id in company_jobs.get(company_id, []):
+            rec.call("POST /company/jobs/<id>/verify", client.post, f"/company/jobs/{job_id}/verify")
+
+    verify_started = time.perf_counter()
+    list(pool.map(verify_all, companies))
+    total_jobs = sum(len(v) for v in company_jobs.values())
+    settled = 0
+    deadline = time.monotonic() + args.settle_timeout
+    while time.monotonic() < deadline:
+        conn = db()
+        settled, unsettled = conn.execute(
+            "SELECT SUM(status='closed'), SUM(status<>'closed') FROM jobs"
+        ).fetchone()
+        conn.close()
+        if not unsettled:
+            break
+        time.sleep(0.05)
+    settle_seconds = time.perf_counter() - verify_started
+    flow_seconds = time.perf_counter() - flow_started
+    pool.shutdown()
+    server.shutdown()
+    ledger.stop()
+
+    return dict(
+        meta=dict(
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            commit=git_commit(), python=platform.python_version(),
+            params={k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        ),
+        routes=rec.summary(),
+        settlements=dict(jobs=total_jobs, settled=settled or 0, seconds=round(settle_seconds, 3),
+                         per_second=round((settled or 0) / settle_seconds, 3) if settle_seconds else None),
+        onboarding_failures=failed_onboarding,
+        flow_seconds=round(flow_seconds, 3),
+        algod_calls=dict(sorted(ledger.counts.items())),
+    )
+
+def print_report(results, baseline=None):
+    base_routes = (baseline or {}).get("routes", {})
+    print(f"{'route':34} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + ("  p95 vs base" if baseline else ""))
+    for label, r in results["routes"].items():
+        line = f"{label:34} {r['count']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        if label in base_routes and base_routes[label]["p95_ms"]:
+            line += f"  {(r['p95_ms'] / base_routes[label]['p95_ms'] - 1) * 100:+.1f}%"
+        print(line)
+    s = results["settlements"]
+    line = f"settled {s['settled']}/{s['jobs']} jobs in {s['seconds']}s ({s['per_second']}/s)"
+    base_rate = (baseline or {}).get("settlements", {}).get("per_second")
+    if base_rate and s["per_second"]:
+        line += f", {(s['per_second'] / base_rate - 1) * 100:+.1f}% vs base"
+    print(line)
+    print(f"whole flow {results['flow_seconds']}s; algod calls {sum(results['algod_calls'].values())}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{results['meta']['commit'] or 'nocommit'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results written to", output)
+    if results["settlements"]["settled"] < results["settlements"]["jobs"] or results["onboarding_failures"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,154 @@
+import base64
+import json
+import os
+import queue
+import re
 import sqlite3
+import time
 
-DB_PATH = "sweatequity.db"
+from flask import g, has_app_context
+from markupsafe import Markup, escape
+
+from services.events import bus as event_bus, EVENT_BUFFER_SIZE
+from services.metrics import observe_sql
+from services.valuation import cap_tables, portfolio_values_scaled
+
+DB_PATH = os.environ.get("VENTRY_DB_PATH", "sweatequity.db")
+DB_POOL_SIZE = int(os.environ.get("VENTRY_DB_POOL_SIZE", "16"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("VENTRY_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.environ.get("VENTRY_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.environ.get("VENTRY_DB_CACHE_SIZE_KB", "20000"))
+JOBS_PAGE_SIZE = int(os.environ.get("JOBS_PAGE_SIZE", "25"))
+MAX_JOBS_PAGE_SIZE = 100
+# Bucket widths, in seconds, kept pre-aggregated for price charts.
+PRICE_ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+MAX_PRICE_SERIES_POINTS = 500
+
+JOB_STATUSES = ('open', 'picked', 'awaiting_verification', 'settling', 'paid', 'closed')
+# dashboard_summaries counter for each job status; developers are never counted against open jobs.
+SUMMARY_JOB_COLUMNS = {'open': 'open_jobs', 'picked': 'picked_jobs', 'awaiting_verification': 'awaiting_jobs',
+                       'settling': 'settling_jobs', 'closed': 'closed_jobs'}
+
+JOBS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      company_id INTEGER NOT NULL,
+      title TEXT NOT NULL,
+      description TEXT,
+      upfront_gbp_pence INTEGER NOT NULL,
+      token_amount INTEGER NOT NULL,
+      developer_id INTEGER,
+      status TEXT CHECK(status IN (""" + ",".join(f"'{st}'" for st in JOB_STATUSES) + """)) DEFAULT 'open',
+      developer_marked_complete INTEGER DEFAULT 0,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY(company_id) REFERENCES companies(id),
+      FOREIGN KEY(developer_id) REFERENCES users(id)
+    )"""
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to the pool; like a real close, uncommitted work is dropped.
+    def close(self):
+        _release(self)
+
+    # Events queued during a transaction are stored in the same commit, and dropped on rollback.
+    def commit(self):
+        events, self.pending_events = self.pending_events, []
+        changed, self.changed_summaries = self.changed_summaries, set()
+        for user_id in changed:
+            events.append(("summary", dashboard_summary(self, user_id), (user_id,)))
+        if events:
+            _store_events(self, events)
+        super().commit()
+        if events:
+            event_bus.poke()
+
+    def rollback(self):
+        super().rollback()
+        self.pending_events, self.changed_summaries = [], set()
+
+    # Statement timings feed the SQL latency metrics; rows fetched later are not included.
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            observe_sql(sql, time.perf_counter() - started)
+
+_idle_connections: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue()
+
+def _connect(path: str) -> PooledConnection:
+    conn = sqlite3.connect(path, factory=PooledConnection, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.db_path = path
+    conn.pending_events, conn.changed_summaries = [], set()
+    return conn
+
+def _release(conn: PooledConnection):
+    if conn.lease is None:
+        return
+    conn.lease = None
+    if conn.in_transaction:
+        conn.rollback()
+    conn.pending_events, conn.changed_summaries = [], set()
+    conn.row_factory = sqlite3.Row
+    if conn.db_path == DB_PATH and _idle_connections.qsize() < DB_POOL_SIZE:
+        _idle_connections.put(conn)
+    else:
+        sqlite3.Connection.close(conn)
 
 def db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = None
+    while conn is None:
+        try:
+            conn = _idle_connections.get_nowait()
+        except queue.Empty:
+            conn = _connect(DB_PATH)
+        if conn.db_path != DB_PATH:
+            sqlite3.Connection.close(conn)
+            conn = None
     conn.row_factory = sqlite3.Row
+    conn.lease = object()
+    if has_app_context():
+        # Anything a request forgets to close is returned when the app context tears down.
+        g.setdefault("_db_leases", []).append((conn, conn.lease))
     return conn
 
+def init_app(app):
+    @app.teardown_appcontext
+    def release_request_connections(exc):
+        for conn, lease in g.pop("_db_leases", []):
+            if conn.lease is lease:
+                _release(conn)
+
 def init_db():
+    # Applies pending migrations in order; PRAGMA user_version records the last one applied.
     conn = db()
-    cur = conn.cursor()
+    try:
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+    finally:
+        conn.close()
+
+def _migration_base_schema(cur):
+    # Idempotent, so databases created before versioning are adopted as-is.
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,21 +177,8 @@ def init_db():
       created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
       FOREIGN KEY(user_id) REFERENCES users(id)
     )""")
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS jobs (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      company_id INTEGER NOT NULL,
-      title TEXT NOT NULL,
-      description TEXT,
-      upfront_gbp_pence INTEGER NOT NULL,
-      token_amount INTEGER NOT NULL,
-      developer_id INTEGER,
-      status TEXT CHECK(status IN ('open','picked','awaiting_verification','paid','closed')) DEFAULT 'open',
-      developer_marked_complete INTEGER DEFAULT 0,
-      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY(company_id) REFERENCES companies(id),
-      FOREIGN KEY(developer_id) REFERENCES users(id)
-    )""")
+    cur.execute(JOBS_TABLE_SQL.format(name="jobs"))
+    _upgrade_job_statuses(cur)
     cur.execute("""
     CREATE TABLE IF NOT EXISTS developer_holdings (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -65,5 +191,645 @@ def init_db():
       FOREIGN KEY(developer_id) REFERENCES users(id),
       FOREIGN KEY(company_id) REFERENCES companies(id)
     )""")
-    conn.commit()
-    conn.close()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS token_prices (
+      app_id INTEGER PRIMARY KEY,
+      price_scaled INTEGER NOT NULL,
+      round INTEGER,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS settlements (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      job_id INTEGER NOT NULL UNIQUE,
+      company_id INTEGER NOT NULL,
+      status TEXT CHECK(status IN ('queued','submitting','confirmed','failed')) DEFAULT 'queued',
+      attempts INTEGER NOT NULL DEFAULT 0,
+      available_at REAL NOT NULL DEFAULT 0,
+      claim TEXT,
+      txid TEXT,
+      first_valid INTEGER,
+      last_valid INTEGER,
+      needs_review INTEGER NOT NULL DEFAULT 0,
+      last_error TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY(job_id) REFERENCES jobs(id),
+      FOREIGN KEY(company_id) REFERENCES companies(id)
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS scheduler_leases (
+      name TEXT PRIMARY KEY,
+      owner TEXT NOT NULL,
+      expires_at REAL NOT NULL
+    )""")
+
+def _migration_hot_path_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_company_created ON jobs(company_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_developer_created ON jobs(developer_id, created_at, status)")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_holdings_developer
+        ON developer_holdings(developer_id, company_id, asset_id, tokens_held)
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_settlements_queue ON settlements(status, id, available_at, company_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_name ON companies(name)")
+
+def _migration_jobs_fulltext(cur):
+    # Only open jobs are indexed, so ranking never walks matches that search would filter out anyway.
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+          title, description, content='jobs', content_rowid='id',
+          tokenize='porter unicode61', prefix='2 3'
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs WHEN new.status = 'open' BEGIN
+          INSERT INTO jobs_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs WHEN old.status = 'open' BEGIN
+          INSERT INTO jobs_fts(jobs_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END
+    """)
+    # One trigger, so the old entry is always removed before the new one goes in.
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF title, description, status ON jobs
+        WHEN old.status = 'open' OR new.status = 'open' BEGIN
+          INSERT INTO jobs_fts(jobs_fts, rowid, title, description)
+            SELECT 'delete', old.id, old.title, old.description WHERE old.status = 'open';
+          INSERT INTO jobs_fts(rowid, title, description)
+            SELECT new.id, new.title, new.description WHERE new.status = 'open';
+        END
+    """)
+    # 'rebuild' would index every row of the content table, so the open rows are copied in by hand.
+    cur.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('delete-all')")
+    cur.execute("INSERT INTO jobs_fts(rowid, title, description) SELECT id, title, description FROM jobs WHERE status='open'")
+
+def _migration_wallet_pool(cur):
+    # The mnemonic is cleared when a wallet is claimed; from then on it lives on the users row only.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS wallet_pool (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      addr TEXT UNIQUE NOT NULL,
+      mnemonic TEXT,
+      status TEXT CHECK(status IN ('unfunded','funding','funded')) DEFAULT 'unfunded',
+      funding_txid TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      status_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      funded_at DATETIME,
+      claimed_at DATETIME
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_wallet_pool_status ON wallet_pool(status, claimed_at, id)")
+
+def _migration_asset_opt_ins(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS asset_opt_ins (
+      developer_id INTEGER NOT NULL,
+      asset_id INTEGER NOT NULL,
+      txid TEXT,
+      opted_in_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY(developer_id, asset_id),
+      FOREIGN KEY(developer_id) REFERENCES users(id)
+    ) WITHOUT ROWID""")
+
+def _migration_company_onboarding(cur):
+    # Companies that finished setup before onboarding was tracked are marked complete.
+    cur.execute("ALTER TABLE companies ADD COLUMN onboarding_status TEXT")
+    cur.execute("ALTER TABLE companies ADD COLUMN asset_txid TEXT")
+    cur.execute("ALTER TABLE companies ADD COLUMN app_txid TEXT")
+    cur.execute("ALTER TABLE companies ADD COLUMN onboarding_error TEXT")
+    cur.execute("ALTER TABLE companies ADD COLUMN onboarding_updated_at DATETIME")
+    cur.execute("ALTER TABLE companies ADD COLUMN onboarding_claim TEXT")
+    cur.execute("UPDATE companies SET onboarding_status='app_deployed' WHERE app_id IS NOT NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_onboarding ON companies(onboarding_status, onboarding_updated_at)")
+
+def _migration_price_history(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS token_price_history (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      app_id INTEGER NOT NULL,
+      ts INTEGER NOT NULL,
+      round INTEGER,
+      price_scaled INTEGER NOT NULL
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_price_history_app_ts ON token_price_history(app_id, ts, id, price_scaled)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS token_price_rollups (
+      app_id INTEGER NOT NULL,
+      resolution INTEGER NOT NULL,
+      bucket INTEGER NOT NULL,
+      min_price INTEGER NOT NULL,
+      max_price INTEGER NOT NULL,
+      last_price INTEGER NOT NULL,
+      last_ts INTEGER NOT NULL,
+      samples INTEGER NOT NULL DEFAULT 1,
+      PRIMARY KEY(app_id, resolution, bucket)
+    ) WITHOUT ROWID""")
+    # Seed each series with the price already mirrored, so charts start from a known value.
+    for row in cur.execute("SELECT app_id, price_scaled, round, updated_at FROM token_prices").fetchall():
+        ts = cur.execute("SELECT CAST(strftime('%s', ?) AS INTEGER)", (row[3],)).fetchone()[0] or int(time.time())
+        _append_price_history(cur, row[0], row[1], row[2], ts)
+
+def _migration_dashboard_summaries(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_summaries (
+      user_id INTEGER PRIMARY KEY,
+      open_jobs INTEGER NOT NULL DEFAULT 0,
+      picked_jobs INTEGER NOT NULL DEFAULT 0,
+      awaiting_jobs INTEGER NOT NULL DEFAULT 0,
+      settling_jobs INTEGER NOT NULL DEFAULT 0,
+      closed_jobs INTEGER NOT NULL DEFAULT 0,
+      tokens_issued INTEGER NOT NULL DEFAULT 0,
+      token_holders INTEGER NOT NULL DEFAULT 0,
+      price_scaled INTEGER,
+      holdings TEXT NOT NULL DEFAULT '[]',
+      portfolio_value_scaled INTEGER NOT NULL DEFAULT 0,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY(user_id) REFERENCES users(id)
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_app ON companies(app_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_holdings_company ON developer_holdings(company_id, developer_id)")
+    rebuild_dashboard_summaries(cur)
+
+def _migration_events(cur):
+    # Dashboard events, relayed to every process's /events streams; see services/events.py.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS events (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      event TEXT NOT NULL,
+      payload TEXT NOT NULL,
+      audience TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_hot_path_indexes,
+    _migration_jobs_fulltext,
+    _migration_wallet_pool,
+    _migration_asset_opt_ins,
+    _migration_company_onboarding,
+    _migration_price_history,
+    _migration_dashboard_summaries,
+    _migration_events,
+]
+
+# name -> (probe, ranked). A probe calls the real helper with representative arguments, so the plans checked
+# are those of the SQL the routes and workers actually run; see check_query_plans().
+HOT_QUERIES = {}
+
+def register_hot_query(name: str, probe, ranked: bool = False):
+    # Ranked queries order their matches by a computed score, so a temp b-tree is expected there.
+    HOT_QUERIES[name] = (probe, ranked)
+
+class _PlanRecorder:
+    def __init__(self, conn):
+        self.conn, self.plans = conn, []
+
+    def execute(self, sql, parameters=()):
+        self.plans.append([row["detail"] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql, parameters)])
+        return self.conn.execute(sql, parameters)
+
+def _bad_plan_step(step: str, ranked: bool) -> bool:
+    if step.startswith("SCAN "):
+        return "CONSTANT ROW" not in step and "VIRTUAL TABLE INDEX" not in step
+    return step.startswith("USE TEMP B-TREE") and not ranked
+
+def check_query_plans(conn) -> dict:
+    # Returns {query name: plan steps} for every hot query that scans a whole table or sorts rows an index
+    # could have returned in order. Probes run inside a transaction that is always rolled back.
+    offenders = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name, (probe, ranked) in HOT_QUERIES.items():
+            recorder = _PlanRecorder(conn)
+            probe(recorder)
+            steps = [step for plan in recorder.plans for step in plan]
+            if any(_bad_plan_step(step, ranked) for step in steps):
+                offenders[name] = steps
+    finally:
+        conn.rollback()
+    return offenders
+
+def _upgrade_job_statuses(cur):
+    # SQLite cannot alter a CHECK constraint, so older databases get the jobs table rebuilt.
+    row = cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='jobs'").fetchone()
+    if all(f"'{st}'" in row["sql"] for st in JOB_STATUSES):
+        return
+    cur.execute(JOBS_TABLE_SQL.format(name="jobs_new"))
+    cur.execute("INSERT INTO jobs_new SELECT * FROM jobs")
+    cur.execute("DROP TABLE jobs")
+    cur.execute("ALTER TABLE jobs_new RENAME TO jobs")
+
+def record_token_price(app_id: int, price_scaled: int, round_: int):
+    # Never let an older round overwrite a newer one; every accepted change is appended to the history.
+    # A stored row without a round predates round tracking, so any write may replace it.
+    conn = db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        previous = conn.execute("SELECT price_scaled FROM token_prices WHERE app_id=?", (app_id,)).fetchone()
+        cur = conn.execute("""
+            INSERT INTO token_prices(app_id, price_scaled, round, updated_at)
+            VALUES(?,?,?,CURRENT_TIMESTAMP)
+            ON CONFLICT(app_id) DO UPDATE SET
+              price_scaled=excluded.price_scaled, round=excluded.round, updated_at=excluded.updated_at
+            WHERE token_prices.round IS NULL OR excluded.round >= token_prices.round
+        """, (app_id, price_scaled, round_))
+        if cur.rowcount == 1 and (previous is None or previous["price_scaled"] != price_scaled):
+            _append_price_history(conn, app_id, price_scaled, round_, int(time.time()))
+            _reprice_dashboard_summaries(conn, app_id, price_scaled)
+            queue_event(conn, "price", dict(app_id=app_id, price_scaled=price_scaled))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _append_price_history(conn, app_id: int, price_scaled: int, round_: int | None, ts: int):
+    conn.execute("INSERT INTO token_price_history(app_id, ts, round, price_scaled) VALUES(?,?,?,?)",
+                 (app_id, ts, round_, price_scaled))
+    conn.executemany("""
+        INSERT INTO token_price_rollups(app_id, resolution, bucket, min_price, max_price, last_price, last_ts)
+        VALUES(?,?,?,?,?,?,?)
+        ON CONFLICT(app_id, resolution, bucket) DO UPDATE SET
+          min_price=MIN(min_price, excluded.min_price),
+          max_price=MAX(max_price, excluded.max_price),
+          last_price=CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_price ELSE last_price END,
+          last_ts=MAX(last_ts, excluded.last_ts),
+          samples=samples+1
+    """, [(app_id, r, ts - ts % r, price_scaled, price_scaled, price_scaled, ts) for r in PRICE_ROLLUP_RESOLUTIONS])
+
+def first_price_ts(conn, app_id: int) -> int | None:
+    return conn.execute("SELECT MIN(ts) FROM token_price_history WHERE app_id=?", (app_id,)).fetchone()[0]
+
+def price_history_series(conn, app_id: int, start_ts: int, end_ts: int, points: int = 120):
+    # Returns [{"t", "min", "max", "last"}] in buckets of equal width; the price is a step function,
+    # so empty buckets carry the previous last price forward.
+    points = max(1, min(points, MAX_PRICE_SERIES_POINTS))
+    span = max(1, end_ts - start_ts)
+    step = max(1, -(-span // points))
+    resolution = max((r for r in PRICE_ROLLUP_RESOLUTIONS if r <= step), default=0)
+    if resolution:
+        # Align output buckets to the rollup grid so every rollup row falls in exactly one of them.
+        step = -(-step // resolution) * resolution
+        start_ts -= start_ts % resolution
+        rows = conn.execute("""
+            SELECT bucket AS ts, min_price, max_price, last_price FROM token_price_rollups
+            WHERE app_id=? AND resolution=? AND bucket >= ? AND bucket <= ? ORDER BY bucket
+        """, (app_id, resolution, start_ts, end_ts)).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT ts, price_scaled AS min_price, price_scaled AS max_price, price_scaled AS last_price
+            FROM token_price_history WHERE app_id=? AND ts >= ? AND ts <= ? ORDER BY ts, id
+        """, (app_id, start_ts, end_ts)).fetchall()
+    before = conn.execute("""
+        SELECT price_scaled FROM token_price_history WHERE app_id=? AND ts < ? ORDER BY ts DESC, id DESC LIMIT 1
+    """, (app_id, start_ts)).fetchone()
+
+    series, last, i = [], before["price_scaled"] if before else None, 0
+    for t in range(start_ts, end_ts + 1, step):
+        lo = hi = last
+        while i < len(rows) and rows[i]["ts"] < t + step:
+            lo = rows[i]["min_price"] if lo is None else min(lo, rows[i]["min_price"])
+            hi = rows[i]["max_price"] if hi is None else max(hi, rows[i]["max_price"])
+            last = rows[i]["last_price"]
+            i += 1
+        if last is not None:
+            series.append(dict(t=t, min=lo, max=hi, last=last))
+    return series
+
+def queue_event(conn, event: str, data, users=None):
+    # Stored by PooledConnection.commit(); other connections (migrations) publish nothing.
+    pending = getattr(conn, "pending_events", None)
+    if pending is not None:
+        pending.append((event, data, users))
+
+def _store_events(conn, events):
+    conn.executemany("INSERT INTO events(event, payload, audience) VALUES(?,?,?)", [
+        (event, json.dumps(data, separators=(",", ":")), json.dumps(sorted(users)) if users is not None else None)
+        for event, data, users in events
+    ])
+
+def events_after(conn, event_id: int, limit: int) -> list:
+    return [tuple(row) for row in conn.execute(
+        "SELECT id, event, payload, audience FROM events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit)
+    ).fetchall()]
+
+def _read_events_after(event_id: int, limit: int) -> list:
+    conn = db()
+    try:
+        return events_after(conn, event_id, limit)
+    finally:
+        conn.close()
+
+def _latest_event_id() -> int:
+    conn = db()
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    finally:
+        conn.close()
+
+event_bus.attach(_read_events_after, _latest_event_id)
+
+def prune_events(keep: int = EVENT_BUFFER_SIZE) -> int:
+    # Keeps as many events as a relay buffers; a stream further behind than that reloads its page anyway.
+    conn = db()
+    try:
+        cur = conn.execute("DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (keep,))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+def _summary_changed(conn, user_id: int):
+    changed = getattr(conn, "changed_summaries", None)
+    if changed is not None:
+        changed.add(user_id)
+
+def _bump_summary(conn, user_id: int, **deltas):
+    _summary_changed(conn, user_id)
+    cols = ", ".join(deltas)
+    conn.execute(f"""
+        INSERT INTO dashboard_summaries(user_id, {cols}) VALUES(?, {",".join("?" * len(deltas))})
+        ON CONFLICT(user_id) DO UPDATE SET
+          {", ".join(f"{c}={c}+excluded.{c}" for c in deltas)}, updated_at=CURRENT_TIMESTAMP
+    """, (user_id, *deltas.values()))
+
+def _write_holdings(conn, user_id: int, holdings: list):
+    _summary_changed(conn, user_id)
+    holdings.sort(key=lambda h: h["company_id"])
+    conn.execute("""
+        INSERT INTO dashboard_summaries(user_id, holdings, portfolio_value_scaled) VALUES(?,?,?)
+        ON CONFLICT(user_id) DO UPDATE SET
+          holdings=excluded.holdings, portfolio_value_scaled=excluded.portfolio_value_scaled,
+          updated_at=CURRENT_TIMESTAMP
+    """, (user_id, json.dumps(holdings), sum(h["tokens"] * h["price_scaled"] for h in holdings)))
+
+def _stored_holdings(conn, user_id: int) -> list:
+    row = conn.execute("SELECT holdings FROM dashboard_summaries WHERE user_id=?", (user_id,)).fetchone()
+    return json.loads(row[0]) if row else []
+
+def record_job_transition(conn, job_id: int, from_status: str | None, to_status: str | None):
+    # Runs inside the caller's transaction, after the jobs row has been updated.
+    job = conn.execute("""
+        SELECT j.developer_id, j.company_id, c.user_id AS company_user_id
+        FROM jobs j JOIN companies c ON c.id = j.company_id WHERE j.id=?
+    """, (job_id,)).fetchone()
+    queue_event(conn, "job", dict(job_id=job_id, company_id=job["company_id"], status=to_status),
+                [u for u in (job["company_user_id"], job["developer_id"]) if u is not None])
+    deltas = {}
+    if from_status in SUMMARY_JOB_COLUMNS:
+        deltas[SUMMARY_JOB_COLUMNS[from_status]] = -1
+    if to_status in SUMMARY_JOB_COLUMNS:
+        deltas[SUMMARY_JOB_COLUMNS[to_status]] = deltas.get(SUMMARY_JOB_COLUMNS[to_status], 0) + 1
+    deltas = {k: v for k, v in deltas.items() if v}
+    if deltas:
+        _bump_summary(conn, job["company_user_id"], **deltas)
+    developer_deltas = {k: v for k, v in deltas.items() if k != "open_jobs"}
+    if job["developer_id"] is not None and developer_deltas:
+        _bump_summary(conn, job["developer_id"], **developer_deltas)
+
+def record_jobs_opened(conn, company_user_id: int, count: int):
+    _bump_summary(conn, company_user_id, open_jobs=count)
+
+def record_tokens_issued(conn, developer_id: int, company_id: int, tokens: int):
+    # Runs inside the settlement transaction that credits developer_holdings.
+    comp = conn.execute("SELECT user_id, name, app_id, asset_id FROM companies WHERE id=?", (company_id,)).fetchone()
+    price = conn.execute("SELECT price_scaled FROM token_prices WHERE app_id=?", (comp["app_id"],)).fetchone()
+    holdings = _stored_holdings(conn, developer_id)
+    holding = next((h for h in holdings if h["company_id"] == company_id), None)
+    new_holder = holding is None
+    if new_holder:
+        holding = dict(company_id=company_id, company_name=comp["name"], app_id=comp["app_id"],
+                       asset_id=comp["asset_id"], tokens=0)
+        holdings.append(holding)
+    holding["tokens"] += tokens
+    holding["price_scaled"] = price["price_scaled"] if price else 0
+    _write_holdings(conn, developer_id, holdings)
+    _bump_summary(conn, comp["user_id"], tokens_issued=tokens, token_holders=int(new_holder))
+
+def record_company_price(conn, company_id: int):
+    # The price app is deployed before its id is stored, so the first price is copied over once it is.
+    row = conn.execute("""
+        SELECT c.user_id, tp.price_scaled FROM companies c JOIN token_prices tp ON tp.app_id = c.app_id WHERE c.id=?
+    """, (company_id,)).fetchone()
+    if row is None:
+        return
+    _summary_changed(conn, row["user_id"])
+    conn.execute("""
+        INSERT INTO dashboard_summaries(user_id, price_scaled) VALUES(?,?)
+        ON CONFLICT(user_id) DO UPDATE SET price_scaled=excluded.price_scaled, updated_at=CURRENT_TIMESTAMP
+    """, (row["user_id"], row["price_scaled"]))
+
+def _reprice_dashboard_summaries(conn, app_id: int, price_scaled: int):
+    comp = conn.execute("SELECT id, user_id FROM companies WHERE app_id=?", (app_id,)).fetchone()
+    if comp is None:
+        return
+    record_company_price(conn, comp["id"])
+    # Patches only this company's entry in each holder's JSON, in place, and moves the portfolio value by
+    # the difference; SET expressions all see the old row, so the delta uses the old price.
+    holders = conn.execute("""
+        UPDATE dashboard_summaries SET
+          holdings = json_set(holdings, (
+            SELECT '$[' || key || '].price_scaled' FROM json_each(holdings) WHERE value ->> 'company_id' = :company_id
+          ), :price_scaled),
+          portfolio_value_scaled = portfolio_value_scaled + (
+            SELECT (value ->> 'tokens') * (:price_scaled - (value ->> 'price_scaled'))
+            FROM json_each(holdings) WHERE value ->> 'company_id' = :company_id
+          ),
+          updated_at = CURRENT_TIMESTAMP
+        WHERE user_id IN (SELECT developer_id FROM developer_holdings WHERE company_id = :company_id)
+          AND EXISTS (SELECT 1 FROM json_each(holdings) WHERE value ->> 'company_id' = :company_id)
+        RETURNING user_id
+    """, dict(company_id=comp["id"], price_scaled=price_scaled)).fetchall()
+    for row in holders:
+        _summary_changed(conn, row["user_id"])
+
+def dashboard_summary(conn, user_id: int) -> dict:
+    row = conn.execute("SELECT * FROM dashboard_summaries WHERE user_id=?", (user_id,)).fetchone()
+    summary = dict(row) if row else dict(
+        open_jobs=0, picked_jobs=0, awaiting_jobs=0, settling_jobs=0, closed_jobs=0, tokens_issued=0,
+        token_holders=0, price_scaled=None, holdings="[]", portfolio_value_scaled=0
+    )
+    summary["holdings"] = json.loads(summary["holdings"])
+    return summary
+
+SUMMARY_FIELDS = ("open_jobs", "picked_jobs", "awaiting_jobs", "settling_jobs", "closed_jobs", "tokens_issued",
+                  "token_holders", "price_scaled", "holdings", "portfolio_value_scaled")
+
+def rebuild_dashboard_summaries(conn, check_only: bool = False) -> list:
+    # Recomputes every summary from the base tables; returns (user_id, field, stored, expected) for each
+    # difference found, and rewrites the table unless check_only is set.
+    expected = {row[0]: dict(open_jobs=0, picked_jobs=0, awaiting_jobs=0, settling_jobs=0, closed_jobs=0,
+                             tokens_issued=0, token_holders=0, price_scaled=None, holdings=[])
+                for row in conn.execute("SELECT id FROM users").fetchall()}
+    for user_id, status, count in conn.execute("""
+        SELECT c.user_id, j.status, COUNT(*) FROM jobs j JOIN companies c ON c.id = j.company_id
+        GROUP BY c.user_id, j.status
+        UNION ALL
+        SELECT developer_id, status, COUNT(*) FROM jobs WHERE developer_id IS NOT NULL AND status <> 'open'
+        GROUP BY developer_id, status
+    """).fetchall():
+        if status in SUMMARY_JOB_COLUMNS and user_id in expected:
+            expected[user_id][SUMMARY_JOB_COLUMNS[status]] += count
+    caps = cap_tables(conn)
+    for company_id, user_id, price in conn.execute("""
+        SELECT c.id, c.user_id, tp.price_scaled FROM companies c LEFT JOIN token_prices tp ON tp.app_id = c.app_id
+    """).fetchall():
+        if user_id in expected:
+            cap = caps[company_id]
+            expected[user_id].update(tokens_issued=cap["issued"], token_holders=len(cap["holders"]),
+                                     price_scaled=price)
+    for row in conn.execute("""
+        SELECT dh.developer_id, dh.company_id, c.name, c.app_id, c.asset_id,
+               SUM(dh.tokens_held), COALESCE(tp.price_scaled, 0)
+        FROM developer_holdings dh
+        JOIN companies c ON c.id = dh.company_id
+        LEFT JOIN token_prices tp ON tp.app_id = c.app_id
+        GROUP BY dh.developer_id, dh.company_id ORDER BY dh.developer_id, dh.company_id
+    """).fetchall():
+        if row[0] in expected:
+            expected[row[0]]["holdings"].append(dict(company_id=row[1], company_name=row[2], app_id=row[3],
+                                                     asset_id=row[4], tokens=row[5], price_scaled=row[6]))
+
+    stored = {row[0]: dict(zip(SUMMARY_FIELDS, row[1:])) for row in conn.execute(
+        f"SELECT user_id, {', '.join(SUMMARY_FIELDS)} FROM dashboard_summaries"
+    ).fetchall()}
+    held = [(user_id, h["price_scaled"], h["tokens"]) for user_id, s in expected.items() for h in s["holdings"]]
+    values = portfolio_values_scaled(*zip(*held)) if held else {}
+    differences = []
+    for user_id, summary in expected.items():
+        summary["portfolio_value_scaled"] = values.get(user_id, 0)
+        current = stored.get(user_id)
+        if current is None:
+            differences.append((user_id, "row", None, "missing"))
+            continue
+        current["holdings"] = sorted(json.loads(current["holdings"]), key=lambda h: h["company_id"])
+        differences.extend((user_id, field, current[field], summary[field])
+                           for field in SUMMARY_FIELDS if current[field] != summary[field])
+    if not check_only:
+        conn.execute("DELETE FROM dashboard_summaries")
+        conn.executemany(f"""
+            INSERT INTO dashboard_summaries(user_id, {", ".join(SUMMARY_FIELDS)})
+            VALUES(?, {",".join("?" * len(SUMMARY_FIELDS))})
+        """, [(user_id, *(json.dumps(s[f]) if f == "holdings" else s[f] for f in SUMMARY_FIELDS))
+              for user_id, s in expected.items()])
+    return differences
+
+def encode_cursor(created_at: str, job_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{job_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None):
+    if not cursor:
+        return None
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().rsplit("|", 1)
+        return created_at, int(job_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def open_jobs_page(conn, cursor: str | None = None, limit: int = JOBS_PAGE_SIZE, company_id: int | None = None,
+                   min_tokens: int | None = None, max_tokens: int | None = None,
+                   min_upfront_pence: int | None = None, max_upfront_pence: int | None = None):
+    # Keyset pagination over (created_at, id), newest first; returns (rows, next_cursor).
+    limit = max(1, min(limit, MAX_JOBS_PAGE_SIZE))
+    where, params = ["j.status='open'"], []
+    after = decode_cursor(cursor)
+    if after:
+        where.append("(j.created_at, j.id) < (?, ?)")
+        params.extend(after)
+    for clause, value in (("j.company_id = ?", company_id),
+                          ("j.token_amount >= ?", min_tokens), ("j.token_amount <= ?", max_tokens),
+                          ("j.upfront_gbp_pence >= ?", min_upfront_pence), ("j.upfront_gbp_pence <= ?", max_upfront_pence)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    rows = conn.execute(f"""
+        SELECT j.*, c.name AS company_name, c.supply AS company_supply
+        FROM jobs j JOIN companies c ON j.company_id=c.id
+        WHERE {" AND ".join(where)}
+        ORDER BY j.created_at DESC, j.id DESC LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return rows[:limit], next_cursor
+
+def company_choices(conn):
+    # For the company filter; name > '' skips companies still in setup and walks idx_companies_name in order.
+    return conn.execute("SELECT id, name FROM companies WHERE name > '' ORDER BY name").fetchall()
+
+def company_for_user(conn, user_id: int):
+    return conn.execute("SELECT * FROM companies WHERE user_id=?", (user_id,)).fetchone()
+
+def developer_current_jobs(conn, developer_id: int):
+    return conn.execute("""
+        SELECT j.*, c.name AS company_name, c.supply AS company_supply
+        FROM jobs j JOIN companies c ON j.company_id=c.id
+        WHERE j.developer_id=? AND j.status IN ('picked','awaiting_verification','settling')
+        ORDER BY j.created_at DESC
+    """, (developer_id,)).fetchall()
+
+def company_jobs_page(conn, company_id: int, cursor: str | None = None, limit: int = JOBS_PAGE_SIZE):
+    # Every status, newest first, paged like open_jobs_page; returns (rows, next_cursor).
+    limit = max(1, min(limit, MAX_JOBS_PAGE_SIZE))
+    where, params = ["j.company_id=?"], [company_id]
+    after = decode_cursor(cursor)
+    if after:
+        where.append("(j.created_at, j.id) < (?, ?)")
+        params.extend(after)
+    rows = conn.execute(f"""
+        SELECT j.*, s.last_error AS settlement_error
+        FROM jobs j LEFT JOIN settlements s ON s.job_id = j.id AND s.status='failed'
+        WHERE {" AND ".join(where)}
+        ORDER BY j.created_at DESC, j.id DESC LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return rows[:limit], next_cursor
+
+JOB_SEARCH_LIMIT = 50
+JOB_SEARCH_MIN_TERM = 2
+
+def _highlight(text: str | None) -> Markup:
+    # FTS markers are control characters, so user text can be escaped before the <mark> tags go in.
+    return Markup(str(escape(text or "")).replace("\x02", "<mark>").replace("\x03", "</mark>"))
+
+def search_open_jobs(conn, query: str, limit: int = JOB_SEARCH_LIMIT):
+    # Every word must match, as a prefix; results are ranked by BM25 with titles weighted over descriptions.
+    # Single characters are dropped: the prefix index starts at two, so they would scan every term.
+    terms = [term for term in re.findall(r"\w+", query) if len(term) >= JOB_SEARCH_MIN_TERM]
+    if not terms:
+        return []
+    match = " ".join(f'"{term}"*' for term in terms)
+    rows = conn.execute("""
+        SELECT j.id, j.upfront_gbp_pence, j.token_amount, c.name AS company_name,
+               highlight(jobs_fts, 0, char(2), char(3)) AS title_hl,
+               snippet(jobs_fts, 1, char(2), char(3), '…', 16) AS snippet
+        FROM jobs_fts
+        JOIN jobs j ON j.id = jobs_fts.rowid
+        JOIN companies c ON c.id = j.company_id
+        WHERE jobs_fts MATCH ? AND j.status='open'
+        ORDER BY bm25(jobs_fts, 10.0, 1.0)
+        LIMIT ?
+    """, (match, limit)).fetchall()
+    return [dict(row, title_hl=_highlight(row["title_hl"]), snippet=_highlight(row["snippet"])) for row in rows]
+
+_OLDEST_CURSOR = encode_cursor("9999-12-31 00:00:00", 0)
+register_hot_query("open_jobs_page", open_jobs_page)
+register_hot_query("open_jobs_page_after", lambda conn: open_jobs_page(conn, _OLDEST_CURSOR))
+register_hot_query("open_jobs_page_filtered", lambda conn: open_jobs_page(
+    conn, _OLDEST_CURSOR, company_id=1, min_tokens=1, max_tokens=100, min_upfront_pence=0, max_upfront_pence=10_000))
+register_hot_query("company_jobs_page", lambda conn: company_jobs_page(conn, 1, _OLDEST_CURSOR))
+register_hot_query("company_choices", company_choices)
+register_hot_query("company_for_user", lambda conn: company_for_user(conn, 1))
+register_hot_query("developer_current_jobs", lambda conn: developer_current_jobs(conn, 1))
+register_hot_query("dashboard_summary", lambda conn: dashboard_summary(conn, 1))
+register_hot_query("search_open_jobs", lambda conn: search_open_jobs(conn, "python dev"), ranked=True)
+register_hot_query("first_price_ts", lambda conn: first_price_ts(conn, 1))
+register_hot_query("price_history_recent", lambda conn: price_history_series(conn, 1, 0, 3600))
+register_hot_query("events_after", lambda conn: events_after(conn, 0, EVENT_BUFFER_SIZE))
+register_hot_query("price_history_rollups", lambda conn: price_history_series(conn, 1, 0, 30 * 86400))
@@ -0,0 +1,13 @@
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from models import init_db
+from services.scheduler import add_periodic_jobs
+
+# Runs the periodic jobs outside the web app; start the web app with VENTRY_RUN_SCHEDULER=0.
+if __name__ == "__main__":
+    init_db()
+    scheduler = add_periodic_jobs(BlockingScheduler())
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
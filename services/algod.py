@@ -0,0 +1,240 @@
+import http.client
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, List
+from urllib import parse
+
+from algosdk import constants
+from algosdk.error import AlgodHTTPError, AlgodResponseError
+from algosdk.v2client.algod import AlgodClient, api_version_path_prefix
+
+from services.metrics import observe_algod
+
+ALGOD_POOL_SIZE = int(os.environ.get("ALGOD_POOL_SIZE", "16"))
+ALGOD_CONNECT_TIMEOUT = float(os.environ.get("ALGOD_CONNECT_TIMEOUT", "3"))
+ALGOD_TIMEOUT = float(os.environ.get("ALGOD_TIMEOUT", "10"))
+ALGOD_RETRIES = int(os.environ.get("ALGOD_RETRIES", "3"))
+ALGOD_BACKOFF_BASE = float(os.environ.get("ALGOD_BACKOFF_BASE", "0.2"))
+ALGOD_BACKOFF_MAX = float(os.environ.get("ALGOD_BACKOFF_MAX", "3"))
+ALGOD_BREAKER_THRESHOLD = int(os.environ.get("ALGOD_BREAKER_THRESHOLD", "5"))
+ALGOD_BREAKER_COOLDOWN = float(os.environ.get("ALGOD_BREAKER_COOLDOWN", "15"))
+
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the node never accepted the request, so even a transaction submit may be resent.
+REJECTED_BEFORE_PROCESSING = {429, 503}
+# Long-poll endpoints keep the timeout the SDK asked for.
+LONG_POLL_PREFIX = "/status/wait-for-block-after/"
+
+class AlgodUnavailableError(Exception):
+    pass
+
+class _Transient(Exception):
+    def __init__(self, error, resend_safe: bool):
+        super().__init__(str(error))
+        self.error = error
+        self.resend_safe = resend_safe
+
+class Endpoint:
+    # One algod node: a bounded pool of keep-alive connections plus a circuit breaker.
+
+    def __init__(self, address: str, pool_size: int = ALGOD_POOL_SIZE):
+        url = parse.urlsplit(address)
+        self.address = address
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port or (443 if self.https else 80)
+        self.base_path = url.path.rstrip("/")
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.open_until = 0.0
+        self._probing = False
+        self.stats = {"requests": 0, "errors": 0, "connections_opened": 0, "breaker_opened": 0}
+
+    def available(self) -> bool:
+        # Closed, or half-open with no other probe in flight.
+        with self._lock:
+            if self.failures < ALGOD_BREAKER_THRESHOLD:
+                return True
+            if time.monotonic() < self.open_until or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.stats["errors"] += 1
+            self._probing = False
+            if self.failures >= ALGOD_BREAKER_THRESHOLD:
+                if self.failures == ALGOD_BREAKER_THRESHOLD:
+                    self.stats["breaker_opened"] += 1
+                self.open_until = time.monotonic() + ALGOD_BREAKER_COOLDOWN
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            with self._lock:
+                self.stats["connections_opened"] += 1
+            return cls(self.host, self.port, timeout=ALGOD_CONNECT_TIMEOUT), False
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method: str, path: str, body, headers: Dict[str, str], timeout: float):
+        with self._lock:
+            self.stats["requests"] += 1
+        conn, reused = self.acquire()
+        sent = False
+        try:
+            if conn.sock is None:
+                conn.connect()
+            conn.sock.settimeout(timeout)
+            conn.request(method, self.base_path + path, body=body, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+            payload = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            # A keep-alive socket the server already closed fails before anything is processed.
+            stale = reused and isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError))
+            raise _Transient(e, resend_safe=not sent or stale)
+        if resp.will_close:
+            conn.close()
+        else:
+            self.release(conn)
+        return resp.status, payload
+
+    def snapshot(self):
+        with self._lock:
+            state = "closed"
+            if self.failures >= ALGOD_BREAKER_THRESHOLD:
+                state = "open" if time.monotonic() < self.open_until else "half-open"
+            return dict(self.stats, address=self.address, breaker=state, idle=self._idle.qsize())
+
+class PooledAlgodClient(AlgodClient):
+    # Replaces the SDK's per-call urllib request with pooled keep-alive connections,
+    # retries with jittered backoff, per-endpoint circuit breakers and failover.
+
+    def __init__(self, algod_token: str, algod_addresses: List[str], headers: Dict[str, str] | None = None):
+        super().__init__(algod_token, algod_addresses[0], headers)
+        self.endpoints = [Endpoint(a) for a in algod_addresses]
+        self._next = 0
+        self._next_lock = threading.Lock()
+        self.stats = {"retries": 0, "failovers": 0, "unavailable": 0}
+
+    def _ordered_endpoints(self):
+        # Round-robin the starting node to spread load; the rest are failover candidates.
+        with self._next_lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.endpoints)
+        return self.endpoints[start:] + self.endpoints[:start]
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None,
+                      response_format="json", timeout=30):
+        # Latency is labelled by the SDK method that made the call, e.g. pending_transaction_info.
+        operation = sys._getframe(1).f_code.co_name
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return self._request(method, requrl, params, data, headers, response_format, timeout)
+        except AlgodHTTPError:
+            outcome = "http_error"
+            raise
+        except Exception:
+            outcome = "unavailable"
+            raise
+        finally:
+            observe_algod(operation, outcome, time.perf_counter() - started)
+
+    def _request(self, method, requrl, params, data, headers, response_format, timeout):
+        header = {"User-Agent": "py-algorand-sdk"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header[constants.algod_auth_header] = self.algod_token
+        long_poll = requrl.startswith(LONG_POLL_PREFIX)
+        if requrl not in constants.unversioned_paths:
+            requrl = api_version_path_prefix + requrl
+        if params:
+            requrl = requrl + "?" + parse.urlencode(params)
+        read_timeout = timeout if long_poll else min(timeout or ALGOD_TIMEOUT, ALGOD_TIMEOUT)
+        idempotent = method.upper() == "GET"
+
+        last_error = None
+        for attempt in range(ALGOD_RETRIES + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                time.sleep(random.uniform(0, min(ALGOD_BACKOFF_MAX, ALGOD_BACKOFF_BASE * 2 ** attempt)))
+            tried = 0
+            for endpoint in self._ordered_endpoints():
+                if not endpoint.available():
+                    continue
+                if tried:
+                    self.stats["failovers"] += 1
+                tried += 1
+                try:
+                    status, payload = endpoint.request(method, requrl, data, header, read_timeout)
+                except _Transient as e:
+                    endpoint.record_failure()
+                    last_error = e.error
+                    if not (idempotent or e.resend_safe):
+                        raise e.error
+                    continue
+                if status in TRANSIENT_STATUSES:
+                    endpoint.record_failure()
+                    last_error = self._http_error(status, payload)
+                    if not (idempotent or status in REJECTED_BEFORE_PROCESSING):
+                        raise last_error
+                    continue
+                endpoint.record_success()
+                if status >= 400:
+                    raise self._http_error(status, payload)
+                return self._decode(status, payload, response_format)
+        self.stats["unavailable"] += 1
+        if last_error is None:
+            raise AlgodUnavailableError("All algod endpoints are unavailable (circuit breakers open)")
+        if isinstance(last_error, AlgodHTTPError):
+            raise last_error
+        raise AlgodUnavailableError(f"algod request failed after {ALGOD_RETRIES + 1} attempts: {last_error}") from last_error
+
+    @staticmethod
+    def _http_error(status: int, payload: bytes) -> AlgodHTTPError:
+        message, data = payload.decode("utf-8", "replace"), None
+        try:
+            j = json.loads(message)
+            message, data = j.get("message", message), j.get("data")
+        except ValueError:
+            pass
+        return AlgodHTTPError(message, status, data)
+
+    @staticmethod
+    def _decode(status: int, payload: bytes, response_format: str):
+        if response_format != "json":
+            return payload
+        if status == 200 and not payload:
+            return {}
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise AlgodResponseError("Failed to parse JSON response from algod") from e
+
+    def transport_stats(self):
+        return dict(self.stats, endpoints=[e.snapshot() for e in self.endpoints])
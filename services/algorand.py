@@ -1,23 +1,66 @@
 import base64
-from typing import Dict, Any
+import copy
+import glob
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, List, Tuple
 from algosdk import account, mnemonic
-from algosdk.v2client.algod import AlgodClient
+from algosdk.error import AlgodHTTPError, ConfirmationTimeoutError, TransactionRejectedError
 from algosdk.transaction import (
     PaymentTxn, AssetConfigTxn, AssetTransferTxn,
     ApplicationCreateTxn, ApplicationNoOpTxn,
-    StateSchema, OnComplete, wait_for_confirmation, assign_group_id
+    StateSchema, OnComplete, assign_group_id
 )
 
-ALGOD_ADDRESS = "http://localhost:4001"
-ALGOD_TOKEN   = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
-algod_client  = AlgodClient(ALGOD_TOKEN, ALGOD_ADDRESS)
+from models import record_token_price
+from services.algod import PooledAlgodClient
+from services.metrics import algod_confirmation_seconds, count_swallowed
+from services.signers import Signer
+
+# ALGOD_ADDRESSES takes a comma-separated list of nodes; requests are spread across them with failover.
+ALGOD_ADDRESSES = [a.strip() for a in os.environ.get(
+    "ALGOD_ADDRESSES", os.environ.get("ALGOD_ADDRESS", "http://localhost:4001")
+).split(",") if a.strip()]
+ALGOD_ADDRESS = ALGOD_ADDRESSES[0]
+ALGOD_TOKEN   = os.environ.get("ALGOD_TOKEN", "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
+algod_client  = PooledAlgodClient(ALGOD_TOKEN, ALGOD_ADDRESSES)
 
 FUNDED_MNEMONIC = "myth unveil brain keep abandon odor daring ripple another prefer source suggest drop rigid gospel foot vague certain hire peace impulse evil trap ability raven"
 FUNDED_SK  = mnemonic.to_private_key(FUNDED_MNEMONIC)
 FUNDED_ADDR = account.address_from_private_key(FUNDED_SK)
 
+# Helpers that sign take either a Signer or a raw private key.
+SignerLike = Signer | bytes
+
+def as_signer(key: SignerLike) -> Signer:
+    return key if isinstance(key, Signer) else Signer(key)
+
 SCALE_GBP = 100  # pence
 
+MAX_GROUP_SIZE = 16
+# Settlement groups get a short validity window, so an unknown outcome can be settled by scanning it.
+SETTLEMENT_VALID_ROUNDS = int(os.environ.get("SETTLEMENT_VALID_ROUNDS", "100"))
+# Each payout is a payment plus an ASA transfer; one slot is kept for the price update.
+PAYOUTS_PER_GROUP = (MAX_GROUP_SIZE - 1) // 2
+
+SUGGESTED_PARAMS_ROUNDS = int(os.environ.get("SUGGESTED_PARAMS_ROUNDS", "10"))
+ALGOD_ROUND_SECONDS = float(os.environ.get("ALGOD_ROUND_SECONDS", "3.3"))
+# Wall-clock limit on a confirmation wait, so callers are released while algod is unreachable.
+CONFIRMATION_TIMEOUT_SECONDS = float(os.environ.get("CONFIRMATION_TIMEOUT_SECONDS", "60"))
+# After a longer gap, pending txids are looked up one by one instead of scanning every missed block.
+MAX_CATCHUP_ROUNDS = int(os.environ.get("MAX_CATCHUP_ROUNDS", "8"))
+
+TEAL_CACHE_DIR = os.environ.get("TEAL_CACHE_DIR", ".teal_cache")
+
+APP_STATE_FETCH_WORKERS = int(os.environ.get("APP_STATE_FETCH_WORKERS", "8"))
+
+_app_state_lock = threading.Lock()
+_app_state_stats = {"fetches": 0, "errors": 0}
+_app_state_pool = ThreadPoolExecutor(max_workers=APP_STATE_FETCH_WORKERS, thread_name_prefix="app-state")
+
 APPROVAL_SOURCE = """
 #pragma version 8
 txn ApplicationID
@@ -74,12 +117,299 @@ int 1
 return
 """
 
+class ConfirmationTracker:
+    # One background thread follows new rounds for every pending txid in the process, so
+    # algod polling grows with rounds rather than with the number of waiting callers.
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: Dict[str, dict] = {}
+        self._thread = None
+        self._block_txids_supported = True
+        self.last_round = None
+        self._lookups = ThreadPoolExecutor(max_workers=8, thread_name_prefix="confirm")
+        self.stats = {"tracked": 0, "confirmed": 0, "rejected": 0, "timed_out": 0, "rounds": 0, "algod_requests": 0}
+
+    def track(self, txid: str, wait_rounds: int = 4) -> Future:
+        with self._cond:
+            entry = self._pending.get(txid)
+            if entry:
+                return entry["future"]
+            fut = Future()
+            started = time.monotonic()
+            self._pending[txid] = {"future": fut, "wait_rounds": wait_rounds, "deadline": None,
+                                   "started": started, "expires_at": started + CONFIRMATION_TIMEOUT_SECONDS}
+            self.stats["tracked"] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="confirmation-tracker", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return fut
+
+    def _run(self):
+        round_ = None
+        while True:
+            with self._cond:
+                while not self._pending:
+                    round_ = None
+                    self._cond.wait()
+            self._expire_overdue()
+            try:
+                if round_ is None:
+                    round_ = self._request(algod_client.status)["last-round"]
+                self._check_new(round_)
+                new_round = self._request(algod_client.status_after_block, round_)["last-round"]
+                self._scan_rounds(round_ + 1, new_round)
+                round_ = self.last_round = new_round
+                self.stats["rounds"] += 1
+                self._expire(round_)
+            except Exception as e:
+                count_swallowed("confirmation_tracker", e)
+                print("Confirmation tracker error:", e)
+                time.sleep(1)
+
+    def _request(self, fn, *args):
+        with self._cond:
+            self.stats["algod_requests"] += 1
+        return fn(*args)
+
+    def _check_new(self, round_: int):
+        # A txid seen for the first time may already be confirmed or rejected.
+        with self._cond:
+            fresh = [txid for txid, e in self._pending.items() if e["deadline"] is None]
+            for txid in fresh:
+                self._pending[txid]["deadline"] = round_ + self._pending[txid]["wait_rounds"]
+        self._lookup(fresh)
+
+    def _scan_rounds(self, first: int, last: int):
+        with self._cond:
+            waiting = set(self._pending)
+        if not waiting or first > last:
+            return
+        if self._block_txids_supported and last - first < MAX_CATCHUP_ROUNDS:
+            try:
+                confirmed = set()
+                for r in range(first, last + 1):
+                    confirmed.update(self._request(algod_client.get_block_txids, r).get("blockTxids") or [])
+                self._lookup(waiting & confirmed)
+                return
+            except AlgodHTTPError:
+                # Older algod without /blocks/{round}/txids: fall back to per-txid checks.
+                self._block_txids_supported = False
+        self._lookup(waiting)
+
+    def _expire_overdue(self):
+        # Needs no algod call, so it still runs while every request is failing.
+        now = time.monotonic()
+        with self._cond:
+            overdue = [txid for txid, e in self._pending.items() if now >= e["expires_at"]]
+        for txid in overdue:
+            self._resolve(txid, error=ConfirmationTimeoutError(
+                f"Wait for transaction id {txid} timed out after {CONFIRMATION_TIMEOUT_SECONDS:g}s"))
+            self.stats["timed_out"] += 1
+
+    def _expire(self, round_: int):
+        with self._cond:
+            expired = [txid for txid, e in self._pending.items() if e["deadline"] is not None and round_ > e["deadline"]]
+        self._lookup(expired, final=True)
+
+    def _lookup(self, txids, final: bool = False):
+        txids = list(txids)
+        infos = self._lookups.map(self._pending_info, txids)
+        for txid, info in zip(txids, infos):
+            if info and info.get("pool-error"):
+                self._resolve(txid, error=TransactionRejectedError("Transaction rejected: " + info["pool-error"]))
+                self.stats["rejected"] += 1
+            elif info and info.get("confirmed-round"):
+                self._resolve(txid, info=info)
+                self.stats["confirmed"] += 1
+            elif final:
+                self._resolve(txid, error=ConfirmationTimeoutError(f"Wait for transaction id {txid} timed out"))
+                self.stats["timed_out"] += 1
+
+    def _pending_info(self, txid: str):
+        try:
+            return self._request(algod_client.pending_transaction_info, txid)
+        except AlgodHTTPError:
+            return None
+
+    def _resolve(self, txid: str, info=None, error=None):
+        with self._cond:
+            entry = self._pending.pop(txid, None)
+        if entry is None:
+            return
+        outcome = "confirmed" if error is None else type(error).__name__
+        algod_confirmation_seconds.observe(time.monotonic() - entry["started"], outcome)
+        if error is not None:
+            entry["future"].set_exception(error)
+        else:
+            entry["future"].set_result(info)
+
+confirmation_tracker = ConfirmationTracker()
+
+def track_confirmation(txid: str, wait_rounds: int = 4) -> Future:
+    return confirmation_tracker.track(txid, wait_rounds)
+
+def submit(stxns) -> Tuple[str, Future]:
+    # Send now, await later: the future resolves to the pending-transaction info once confirmed.
+    try:
+        if isinstance(stxns, list):
+            txid = algod_client.send_transactions(stxns)
+        else:
+            txid = algod_client.send_transaction(stxns)
+    except AlgodHTTPError as e:
+        message = str(e).lower()
+        if "txn dead" in message or "fee" in message:
+            suggested_params_cache.invalidate()
+        raise
+    return txid, track_confirmation(txid)
+
+class SuggestedParamsCache:
+    # Suggested params stay usable for SUGGESTED_PARAMS_ROUNDS rounds after they were fetched;
+    # the current round comes from the confirmation tracker or, failing that, from the clock.
+
+    def __init__(self, valid_rounds: int = SUGGESTED_PARAMS_ROUNDS):
+        self.valid_rounds = valid_rounds
+        self._lock = threading.Lock()
+        self._params = None
+        self._fetched_at = 0.0
+        self._last_used = 0.0
+        self._refresher = None
+        self.stats = {"hits": 0, "fetches": 0, "invalidations": 0, "background_refreshes": 0}
+
+    def get(self):
+        with self._lock:
+            self._last_used = time.monotonic()
+            if self._params is not None and self._fresh():
+                self.stats["hits"] += 1
+                return copy.copy(self._params)
+        params = self._fetch()
+        self._ensure_refresher()
+        return copy.copy(params)
+
+    def invalidate(self):
+        with self._lock:
+            self._params = None
+            self.stats["invalidations"] += 1
+
+    def _estimated_round(self) -> float:
+        elapsed_rounds = (time.monotonic() - self._fetched_at) / ALGOD_ROUND_SECONDS
+        return max(self._params.first + elapsed_rounds, confirmation_tracker.last_round or 0)
+
+    def _fresh(self, margin: float = 0) -> bool:
+        return self._estimated_round() + margin < self._params.first + self.valid_rounds
+
+    def _fetch(self):
+        params = algod_client.suggested_params()
+        with self._lock:
+            self._params = params
+            self._fetched_at = time.monotonic()
+            self.stats["fetches"] += 1
+        return params
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="suggested-params", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        # Refresh ahead of expiry while the cache is in use, so senders rarely wait on algod.
+        interval = max(1.0, self.valid_rounds * ALGOD_ROUND_SECONDS / 2)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                idle = time.monotonic() - self._last_used > self.valid_rounds * ALGOD_ROUND_SECONDS
+                due = self._params is None or not self._fresh(margin=self.valid_rounds / 2)
+            if idle:
+                return
+            if due:
+                try:
+                    self._fetch()
+                    with self._lock:
+                        self.stats["background_refreshes"] += 1
+                except Exception as e:
+                    count_swallowed("suggested_params_refresh", e)
+                    print("Suggested params refresh failed:", e)
+
+suggested_params_cache = SuggestedParamsCache()
+
+def suggested_params_stats() -> Dict[str, int]:
+    with suggested_params_cache._lock:
+        return dict(suggested_params_cache.stats, algod_requests_saved=suggested_params_cache.stats["hits"])
+
+def confirmation_stats() -> Dict[str, int]:
+    with confirmation_tracker._cond:
+        return dict(confirmation_tracker.stats, pending=len(confirmation_tracker._pending))
+
+def current_round() -> int:
+    return algod_client.status()["last-round"]
+
 def suggested():
-    return algod_client.suggested_params()
+    return suggested_params_cache.get()
+
+_compiled_programs: Dict[str, bytes] = {}
+_compile_lock = threading.Lock()
+_algod_version = None
+
+def _algod_version_tag() -> str | None:
+    global _algod_version
+    if _algod_version is None:
+        try:
+            build = algod_client.versions()["build"]
+            _algod_version = f"{build['major']}.{build['minor']}.{build['build_number']}-{build['commit_hash']}"
+        except Exception as e:
+            count_swallowed("algod_version", e)
+            return None
+    return _algod_version
+
+def _cached_program_path(source_hash: str, version: str) -> str:
+    return os.path.join(TEAL_CACHE_DIR, f"{source_hash}-{version}.bin")
+
+def _any_cached_program(source_hash: str) -> bytes | None:
+    paths = sorted(glob.glob(os.path.join(TEAL_CACHE_DIR, f"{source_hash}-*.bin")), key=os.path.getmtime)
+    if not paths:
+        return None
+    with open(paths[-1], "rb") as f:
+        return f.read()
 
 def compile_source(source: str) -> bytes:
-    res = algod_client.compile(source)
-    return base64.b64decode(res["result"])
+    # Compiled bytecode is cached in memory and on disk, keyed by source hash and algod version.
+    source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    version = _algod_version_tag()
+    key = f"{source_hash}-{version}"
+    with _compile_lock:
+        if key in _compiled_programs:
+            return _compiled_programs[key]
+    path = _cached_program_path(source_hash, version) if version else None
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            program = f.read()
+    else:
+        try:
+            if version is None:
+                raise RuntimeError("algod version unavailable")
+            program = base64.b64decode(algod_client.compile(source)["result"])
+        except Exception as e:
+            count_swallowed("teal_compile", e)
+            # The same source compiles to the same bytecode across algod builds.
+            program = _any_cached_program(source_hash)
+            if program is None:
+                raise
+        else:
+            os.makedirs(TEAL_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(program)
+            os.replace(tmp, path)
+    with _compile_lock:
+        _compiled_programs[key] = program
+    return program
+
+def warm_program_cache():
+    for source in (APPROVAL_SOURCE, CLEAR_SOURCE):
+        compile_source(source)
 
 def generate_wallet():
     sk, addr = account.generate_account()
@@ -88,12 +418,33 @@ def generate_wallet():
 def fund_account(receiver_addr: str, amount_microalgos: int):
     txn = PaymentTxn(FUNDED_ADDR, suggested(), receiver_addr, amount_microalgos)
     stxn = txn.sign(FUNDED_SK)
-    txid = algod_client.send_transaction(stxn)
-    wait_for_confirmation(algod_client, txid, 4)
+    txid, confirmed = submit(stxn)
+    confirmed.result()
     return txid
 
-def create_asa(creator_sk: bytes, unit_name: str, asset_name: str, total_supply: int, decimals: int = 0) -> int:
-    sender = account.address_from_private_key(creator_sk)
+def fund_accounts_batch(receiver_addrs: List[str], amount_microalgos: int,
+                        on_submitted: Callable[[List[str], str], None] | None = None) -> List[str]:
+    # Faucet payments go out as atomic groups of up to MAX_GROUP_SIZE; returns the first txid of each group.
+    sp = suggested()
+    txids, pending = [], []
+    for start in range(0, len(receiver_addrs), MAX_GROUP_SIZE):
+        chunk = receiver_addrs[start:start + MAX_GROUP_SIZE]
+        txns = [PaymentTxn(FUNDED_ADDR, sp, addr, amount_microalgos) for addr in chunk]
+        if len(txns) > 1:
+            assign_group_id(txns)
+        txid, confirmed = submit([t.sign(FUNDED_SK) for t in txns])
+        if on_submitted:
+            on_submitted(chunk, txid)
+        txids.append(txid)
+        pending.append(confirmed)
+    for confirmed in pending:
+        confirmed.result()
+    return txids
+
+def create_asa(creator: SignerLike, unit_name: str, asset_name: str, total_supply: int, decimals: int = 0,
+               on_submitted: Callable[[str], None] | None = None) -> int:
+    creator = as_signer(creator)
+    sender = creator.addr
     txn = AssetConfigTxn(
         sender=sender, sp=suggested(),
         total=total_supply, decimals=decimals, default_frozen=False,
@@ -101,29 +452,32 @@ def create_asa(creator_sk: bytes, unit_name: str, asset_name: str, total_supply:
         manager=sender, reserve=sender, freeze=sender, clawback=sender,
         url="http://example.com"
     )
-    stxn = txn.sign(creator_sk)
-    txid = algod_client.send_transaction(stxn)
-    res = wait_for_confirmation(algod_client, txid, 4)
-    return res["asset-index"]
-
-def ensure_opt_in(acct_sk: bytes, asset_id: int):
-    addr = account.address_from_private_key(acct_sk)
-    txn = AssetTransferTxn(sender=addr, sp=suggested(), receiver=addr, amt=0, index=asset_id)
-    stxn = txn.sign(acct_sk)
-    txid = algod_client.send_transaction(stxn)
-    wait_for_confirmation(algod_client, txid, 4)
+    stxn = creator.sign(txn)
+    txid, confirmed = submit(stxn)
+    if on_submitted:
+        on_submitted(txid)
+    return confirmed.result()["asset-index"]
+
+def ensure_opt_in(acct: SignerLike, asset_id: int):
+    acct = as_signer(acct)
+    txn = AssetTransferTxn(sender=acct.addr, sp=suggested(), receiver=acct.addr, amt=0, index=asset_id)
+    stxn = acct.sign(txn)
+    txid, confirmed = submit(stxn)
+    confirmed.result()
     return txid
 
-def transfer_asa(sender_sk: bytes, receiver_addr: str, asset_id: int, amount: int):
-    sender_addr = account.address_from_private_key(sender_sk)
-    txn = AssetTransferTxn(sender=sender_addr, sp=suggested(), receiver=receiver_addr, amt=amount, index=asset_id)
-    stxn = txn.sign(sender_sk)
-    txid = algod_client.send_transaction(stxn)
-    wait_for_confirmation(algod_client, txid, 4)
+def transfer_asa(sender: SignerLike, receiver_addr: str, asset_id: int, amount: int):
+    sender = as_signer(sender)
+    txn = AssetTransferTxn(sender=sender.addr, sp=suggested(), receiver=receiver_addr, amt=amount, index=asset_id)
+    stxn = sender.sign(txn)
+    txid, confirmed = submit(stxn)
+    confirmed.result()
     return txid
 
-def deploy_price_app(company_sk: bytes, token_id: int, initial_price_scaled_gbp: int) -> int:
-    creator_addr = account.address_from_private_key(company_sk)
+def deploy_price_app(company: SignerLike, token_id: int, initial_price_scaled_gbp: int,
+                     on_submitted: Callable[[str], None] | None = None) -> int:
+    company = as_signer(company)
+    creator_addr = company.addr
     approval = compile_source(APPROVAL_SOURCE)
     clear    = compile_source(CLEAR_SOURCE)
     txn = ApplicationCreateTxn(
@@ -134,20 +488,55 @@ def deploy_price_app(company_sk: bytes, token_id: int, initial_price_scaled_gbp:
         local_schema=StateSchema(num_uints=0, num_byte_slices=0),
         app_args=[b"init", token_id.to_bytes(8,"big"), initial_price_scaled_gbp.to_bytes(8,"big")]
     )
-    stxn = txn.sign(company_sk)
-    txid = algod_client.send_transaction(stxn)
-    res = wait_for_confirmation(algod_client, txid, 4)
-    return res["application-index"]
+    stxn = company.sign(txn)
+    txid, confirmed = submit(stxn)
+    if on_submitted:
+        on_submitted(txid)
+    res = confirmed.result()
+    app_id = res["application-index"]
+    record_token_price(app_id, initial_price_scaled_gbp, res["confirmed-round"])
+    return app_id
 
-def update_token_price(company_sk: bytes, app_id: int, new_price_scaled_gbp: int):
-    sender = account.address_from_private_key(company_sk)
+def update_token_price(company: SignerLike, app_id: int, new_price_scaled_gbp: int):
+    company = as_signer(company)
     app_args = [b"update_token_price", new_price_scaled_gbp.to_bytes(8, "big")]
-    txn = ApplicationNoOpTxn(sender, suggested(), app_id, app_args)
-    stxn = txn.sign(company_sk)
-    txid = algod_client.send_transaction(stxn)
-    wait_for_confirmation(algod_client, txid, 4)
+    txn = ApplicationNoOpTxn(company.addr, suggested(), app_id, app_args)
+    stxn = company.sign(txn)
+    txid, confirmed = submit(stxn)
+    res = confirmed.result()
+    record_token_price(app_id, new_price_scaled_gbp, res["confirmed-round"])
     return txid
 
+def pending_info(txid: str) -> Dict[str, Any]:
+    return algod_client.pending_transaction_info(txid)
+
+def account_balance(addr: str) -> int:
+    return algod_client.account_info(addr).get("amount", 0)
+
+def is_opted_in(addr: str, asset_id: int) -> bool:
+    try:
+        algod_client.account_asset_info(addr, asset_id)
+    except AlgodHTTPError as e:
+        if e.code == 404:
+            return False
+        raise
+    return True
+
+def find_created_asset(creator_addr: str, unit_name: str, asset_name: str) -> int | None:
+    for asset in algod_client.account_info(creator_addr).get("created-assets", []):
+        params = asset.get("params", {})
+        if params.get("unit-name") == unit_name and params.get("name") == asset_name:
+            return asset["index"]
+    return None
+
+def find_created_price_app(creator_addr: str, token_id: int) -> int | None:
+    token_key = base64.b64encode(b"token_id").decode()
+    for app in algod_client.account_info(creator_addr).get("created-apps", []):
+        for kv in app.get("params", {}).get("global-state", []):
+            if kv["key"] == token_key and kv["value"].get("uint") == token_id:
+                return app["id"]
+    return None
+
 def get_app_state(app_id: int) -> Dict[str, Any]:
     info = algod_client.application_info(app_id)
     gs = info["params"].get("global-state", [])
@@ -159,9 +548,33 @@ def get_app_state(app_id: int) -> Dict[str, Any]:
         elif v["type"] == 1: out[k] = base64.b64decode(v["bytes"])
     return out
 
-def atomic_approve_and_pay(company_sk: bytes, company_addr: str, dev_addr: str, app_id: int,
+def get_app_states(app_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    # Always read fresh, concurrently; apps that fail to load are left out of the result.
+    futures = {app_id: _app_state_pool.submit(get_app_state, app_id) for app_id in set(app_ids)}
+    out: Dict[int, Dict[str, Any]] = {}
+    for app_id, fut in futures.items():
+        try:
+            out[app_id] = fut.result()
+        except Exception as e:
+            count_swallowed("app_state_fetch", e)
+            with _app_state_lock:
+                _app_state_stats["errors"] += 1
+    with _app_state_lock:
+        _app_state_stats["fetches"] += len(futures)
+    return out
+
+def algod_transport_stats() -> Dict[str, Any]:
+    return algod_client.transport_stats()
+
+def app_state_fetch_stats() -> Dict[str, int]:
+    with _app_state_lock:
+        return dict(_app_state_stats)
+
+def atomic_approve_and_pay(company: SignerLike, dev_addr: str, app_id: int,
                            asset_id: int, upfront_microalgos: int, token_amount: int,
-                           new_price_scaled_gbp: int):
+                           new_price_scaled_gbp: int, on_submitted: Callable[[str], None] | None = None):
+    company = as_signer(company)
+    company_addr = company.addr
     sp = suggested()
     pay_txn = PaymentTxn(company_addr, sp, dev_addr, upfront_microalgos)
     asa_txn = AssetTransferTxn(company_addr, sp, dev_addr, token_amount, asset_id)
@@ -169,7 +582,53 @@ def atomic_approve_and_pay(company_sk: bytes, company_addr: str, dev_addr: str,
     app_txn = ApplicationNoOpTxn(company_addr, sp, app_id, app_args)
 
     assign_group_id([pay_txn, asa_txn, app_txn])
-    stxns = [pay_txn.sign(company_sk), asa_txn.sign(company_sk), app_txn.sign(company_sk)]
-    txid = algod_client.send_transactions(stxns)
-    wait_for_confirmation(algod_client, txid, 4)
+    stxns = [company.sign(pay_txn), company.sign(asa_txn), company.sign(app_txn)]
+    txid, confirmed = submit(stxns)
+    if on_submitted:
+        on_submitted(txid)
+    res = confirmed.result()
+    record_token_price(app_id, new_price_scaled_gbp, res["confirmed-round"])
     return txid
+
+def atomic_approve_and_pay_batch(company: SignerLike, app_id: int, asset_id: int,
+                                 payouts: List[Tuple[str, int, int]], new_price_scaled_gbp: int,
+                                 on_submitted: Callable[[int, str, int, int], None] | None = None
+                                 ) -> Tuple[List[str], int]:
+    # payouts are (dev_addr, upfront_microalgos, token_amount); returns the first txid of each group and
+    # the last confirmed round. on_submitted gets (group, txid, first valid round, last valid round).
+    # Recording the new price is left to the caller, which also has to do it for recovered settlements.
+    company = as_signer(company)
+    company_addr = company.addr
+    sp = suggested()
+    sp.last = min(sp.last, sp.first + SETTLEMENT_VALID_ROUNDS)
+    app_args = [b"update_token_price", new_price_scaled_gbp.to_bytes(8,"big")]
+    groups = []
+    for start in range(0, len(payouts), PAYOUTS_PER_GROUP):
+        txns = []
+        for k, (dev_addr, upfront_microalgos, token_amount) in enumerate(payouts[start:start + PAYOUTS_PER_GROUP]):
+            # Two identical payouts to one developer would otherwise be duplicate transactions.
+            note = f"payout:{k}".encode()
+            txns.append(PaymentTxn(company_addr, sp, dev_addr, upfront_microalgos, note=note))
+            txns.append(AssetTransferTxn(company_addr, sp, dev_addr, token_amount, asset_id, note=note))
+        txns.append(ApplicationNoOpTxn(company_addr, sp, app_id, app_args))
+        assign_group_id(txns)
+        groups.append([company.sign(t) for t in txns])
+
+    txids, pending = [], []
+    for n, stxns in enumerate(groups):
+        txid, confirmed = submit(stxns)
+        if on_submitted:
+            on_submitted(n, txid, sp.first, sp.last)
+        txids.append(txid)
+        pending.append(confirmed)
+    confirmed_round = 0
+    for confirmed in pending:
+        confirmed_round = max(confirmed_round, confirmed.result()["confirmed-round"])
+    return txids, confirmed_round
+
+def find_confirmed_round(txid: str, first_round: int, last_round: int) -> int | None:
+    # Scans the blocks of a validity window for txid; raises AlgodHTTPError if a block cannot be read.
+    for round_ in range(first_round, last_round + 1):
+        if txid in (algod_client.get_block_txids(round_).get("blockTxids") or []):
+            return round_
+    return None
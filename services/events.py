@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator
+
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "4096"))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+EVENT_POLL_SECONDS = float(os.environ.get("EVENT_POLL_SECONDS", "0.5"))
+
+class EventBus:
+    # Events are rows in the events table, written by whichever process commits them, so web workers also
+    # see those of the scheduler process and of each other. One relay thread per process copies new rows into
+    # a shared ring buffer and wakes every listener; each listener keeps only its position in the buffer, so
+    # publishing costs the same however many streams are open. Row ids are the SSE ids in every process.
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=size)
+        self._seq = 0
+        # Events at or below the floor may be gone from the buffer.
+        self._floor = 0
+        self._listeners = 0
+        self._stats = dict(published=0, resets=0, relay_errors=0)
+        self._read_after = self._latest = None
+        self._relay = None
+        self._start_lock = threading.Lock()
+        self._poke = threading.Event()
+
+    def attach(self, read_after: Callable[[int, int], list], latest: Callable[[], int]):
+        # read_after(id, limit) returns up to limit (id, event, json payload, json user ids or None) rows
+        # after id, in order; latest() returns the highest stored id.
+        self._read_after, self._latest = read_after, latest
+
+    def _start_relay(self):
+        if self._relay is not None or self._read_after is None:
+            return
+        with self._start_lock:
+            if self._relay is not None:
+                return
+            # The buffer is preloaded, so a stream that reconnects to another worker resumes where it was.
+            self._seq = self._floor = max(0, self._latest() - self._events.maxlen)
+            self._pull()
+            relay = threading.Thread(target=self._run_relay, name="event-relay", daemon=True)
+            relay.start()
+            self._relay = relay
+
+    def _run_relay(self):
+        while True:
+            self._poke.wait(EVENT_POLL_SECONDS)
+            self._poke.clear()
+            try:
+                self._pull()
+            except Exception as e:
+                with self._cond:
+                    self._stats["relay_errors"] += 1
+                print("Event relay warning:", e)
+                time.sleep(EVENT_POLL_SECONDS)
+
+    def _pull(self):
+        while True:
+            rows = self._read_after(self._seq, self._events.maxlen)
+            if not rows:
+                return
+            with self._cond:
+                for event_id, event, payload, audience in rows:
+                    if len(self._events) == self._events.maxlen:
+                        self._floor = self._events[0][0]
+                    self._events.append((event_id, event, payload,
+                                         frozenset(json.loads(audience)) if audience is not None else None))
+                self._seq = rows[-1][0]
+                self._stats["published"] += len(rows)
+                self._cond.notify_all()
+            if len(rows) < self._events.maxlen:
+                return
+
+    def poke(self):
+        # Called after a local commit that stored events, so this process relays them without waiting a poll.
+        self._poke.set()
+
+    def listen(self, user_id: int, last_id: int | None = None,
+               heartbeat: float = EVENT_HEARTBEAT_SECONDS) -> Iterator[tuple | None]:
+        # Yields (id, event, json payload) for this user, or None after heartbeat seconds of quiet.
+        # A "reset" event with no id means events were missed and the page should reload.
+        self._start_relay()
+        with self._cond:
+            self._listeners += 1
+            cursor = self._seq if last_id is None else last_id
+        try:
+            while True:
+                with self._cond:
+                    quiet = cursor >= self._seq and not self._cond.wait(heartbeat)
+                    missed = cursor < self._floor
+                    if missed:
+                        self._stats["resets"] += 1
+                        batch = []
+                    else:
+                        # Ids only grow, so the unseen events are at the right end of the buffer.
+                        batch = []
+                        for item in reversed(self._events):
+                            if item[0] <= cursor:
+                                break
+                            batch.append(item)
+                        batch.reverse()
+                    # A stream resumed on another worker may be ahead of this relay for a moment.
+                    cursor = max(cursor, self._seq)
+                if missed:
+                    yield None, "reset", "{}"
+                for seq, event, payload, audience in batch:
+                    if audience is None or user_id in audience:
+                        yield seq, event, payload
+                if quiet:
+                    yield None
+        finally:
+            with self._cond:
+                self._listeners -= 1
+
+    @property
+    def last_id(self) -> int:
+        self._start_relay()
+        return self._seq
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, listeners=self._listeners, buffered=len(self._events), last_id=self._seq)
+
+bus = EventBus()
+
+def last_event_id() -> int:
+    # Rendered into pages so their stream resumes from the state they were rendered with.
+    return bus.last_id
+
+def event_stats():
+    return bus.stats()
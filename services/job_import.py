@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import os
+import time
+from typing import IO, Iterator
+
+from models import record_jobs_opened
+
+JOB_IMPORT_BATCH_SIZE = int(os.environ.get("JOB_IMPORT_BATCH_SIZE", "1000"))
+JOB_IMPORT_MAX_ROWS = int(os.environ.get("JOB_IMPORT_MAX_ROWS", "50000"))
+# Only the first errors are listed; the rest are still counted.
+JOB_IMPORT_MAX_ERRORS = 1000
+JOB_TITLE_MAX_LENGTH = 200
+IMPORT_FORMATS = ("csv", "jsonl")
+
+def detect_format(filename: str | None, content_type: str | None, requested: str | None = None) -> str:
+    if requested in IMPORT_FORMATS:
+        return requested
+    name = (filename or "").lower()
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")) or mimetype in (
+        "application/jsonl", "application/x-ndjson", "application/x-jsonlines", "application/json"
+    ):
+        return "jsonl"
+    return "csv"
+
+def iter_rows(stream: IO[bytes], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    # Yields (line number, fields, parse error) one row at a time; the upload is never read in whole.
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, None, "Too many columns."
+            elif any(v and v.strip() for v in row.values()):
+                yield reader.line_num, row, None
+        return
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(row, dict):
+            yield line_no, row, None
+        else:
+            yield line_no, None, "Each line must be a JSON object."
+
+def parse_job_row(row: dict) -> tuple[str, str, int, int]:
+    # Same fields as the new task form; raises ValueError with a message meant for the uploader.
+    title = str(row.get("title") or "").strip()
+    if not title:
+        raise ValueError("title is required.")
+    if len(title) > JOB_TITLE_MAX_LENGTH:
+        raise ValueError(f"title is longer than {JOB_TITLE_MAX_LENGTH} characters.")
+    description = str(row.get("description") or "").strip()
+    try:
+        upfront_gbp_pence = int(round(float(row.get("upfront_gbp")) * 100))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("upfront_gbp must be a number.") from None
+    try:
+        token_amount = int(str(row.get("token_amount")).strip())
+    except ValueError:
+        raise ValueError("token_amount must be a whole number.") from None
+    if upfront_gbp_pence < 0 or token_amount <= 0:
+        raise ValueError("upfront_gbp cannot be negative and token_amount must be positive.")
+    return title, description, upfront_gbp_pence, token_amount
+
+def import_jobs(conn, company_id: int, company_user_id: int, rows) -> dict:
+    # Valid rows are inserted in batches, one transaction each; invalid rows are reported and skipped.
+    started = time.perf_counter()
+    inserted, failed, errors, batch = 0, 0, [], []
+
+    def flush():
+        nonlocal inserted
+        if not batch:
+            return
+        conn.executemany("""
+            INSERT INTO jobs(company_id,title,description,upfront_gbp_pence,token_amount)
+            VALUES(?,?,?,?,?)
+        """, batch)
+        record_jobs_opened(conn, company_user_id, len(batch))
+        conn.commit()
+        inserted += len(batch)
+        batch.clear()
+
+    def reject(line_no, error):
+        nonlocal failed
+        failed += 1
+        if len(errors) < JOB_IMPORT_MAX_ERRORS:
+            errors.append(dict(row=line_no, error=error))
+
+    line_no = 0
+    try:
+        for count, (line_no, row, error) in enumerate(rows, start=1):
+            if count > JOB_IMPORT_MAX_ROWS:
+                reject(line_no, f"Imports are limited to {JOB_IMPORT_MAX_ROWS} rows; the rest of the file was not read.")
+                break
+            if error is None:
+                try:
+                    batch.append((company_id, *parse_job_row(row)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                reject(line_no, error)
+            if len(batch) >= JOB_IMPORT_BATCH_SIZE:
+                flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        reject(line_no + 1, f"Could not read the rest of the file: {e}")
+    flush()
+    return dict(inserted=inserted, failed=failed, errors=errors,
+                duration_seconds=round(time.perf_counter() - started, 3))
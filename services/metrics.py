@@ -0,0 +1,221 @@
+import hmac
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Tuple
+
+from flask import before_render_template, g, request, template_rendered
+
+# 0 disables the slow-request log.
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+# /metrics is served only when this is set, to scrapers sending "Authorization: Bearer <token>".
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PREFIX = "ventry_"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, name: str, help_: str, label_names: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then sum and count.
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {series[-2]}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help = help_
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+http_request_seconds = Histogram(METRICS_PREFIX + "http_request_seconds", "Flask request latency by route.",
+                                 ("method", "route", "status"))
+sql_statement_seconds = Histogram(METRICS_PREFIX + "sql_statement_seconds", "SQLite execute latency by statement.",
+                                  ("statement",))
+algod_request_seconds = Histogram(METRICS_PREFIX + "algod_request_seconds", "algod HTTP latency by SDK operation.",
+                                  ("operation", "outcome"))
+algod_confirmation_seconds = Histogram(METRICS_PREFIX + "algod_confirmation_seconds",
+                                       "Time from submit to confirmation or rejection.", ("outcome",),
+                                       buckets=(1, 2.5, 5, 7.5, 10, 15, 20, 30, 60))
+template_render_seconds = Histogram(METRICS_PREFIX + "template_render_seconds", "Jinja render latency by template.",
+                                    ("template",))
+scheduler_job_seconds = Histogram(METRICS_PREFIX + "scheduler_job_seconds", "Periodic job run duration.",
+                                  ("job", "outcome"), buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+swallowed_exceptions = Counter(METRICS_PREFIX + "swallowed_exceptions_total",
+                               "Exceptions caught and handled without re-raising.", ("site", "type"))
+
+_collectors: Dict[str, Callable[[], Dict]] = {}
+
+def register_collector(name: str, fn: Callable[[], Dict]):
+    # Numeric values of an existing *_stats() dict are exported as gauges.
+    _collectors[name] = fn
+
+def count_swallowed(site: str, error: BaseException):
+    swallowed_exceptions.inc(site, type(error).__name__)
+
+# Per-request time spent in SQL, algod and rendering, for the slow-request log.
+_breakdown: ContextVar[dict | None] = ContextVar("request_breakdown", default=None)
+
+def _add_to_breakdown(kind: str, seconds: float):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[kind + "_ms"] += seconds * 1000
+        breakdown[kind + "_calls"] += 1
+
+def start_request_breakdown():
+    return _breakdown.set(dict(sql_ms=0.0, sql_calls=0, algod_ms=0.0, algod_calls=0, render_ms=0.0, render_calls=0))
+
+def finish_request_breakdown(token, label: str, seconds: float):
+    breakdown = _breakdown.get()
+    _breakdown.reset(token)
+    if breakdown is None or not SLOW_REQUEST_MS or seconds * 1000 < SLOW_REQUEST_MS:
+        return
+    other_ms = seconds * 1000 - breakdown["sql_ms"] - breakdown["algod_ms"] - breakdown["render_ms"]
+    print(f"Slow request: {label} {seconds * 1000:.1f}ms "
+          f"sql={breakdown['sql_ms']:.1f}ms/{breakdown['sql_calls']} "
+          f"algod={breakdown['algod_ms']:.1f}ms/{breakdown['algod_calls']} "
+          f"render={breakdown['render_ms']:.1f}ms/{breakdown['render_calls']} other={other_ms:.1f}ms")
+
+_placeholder_lists = re.compile(r"\?(\s*,\s*\?)+")
+_whitespace = re.compile(r"\s+")
+_statement_labels: Dict[str, str] = {}
+
+def statement_label(sql: str) -> str:
+    # IN (?,?,?) lists of any length share one label, so label cardinality stays bounded.
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = _placeholder_lists.sub("?…", _whitespace.sub(" ", sql).strip())[:160]
+        if len(_statement_labels) < 4096:
+            _statement_labels[sql] = label
+    return label
+
+def observe_sql(sql: str, seconds: float):
+    sql_statement_seconds.observe(seconds, statement_label(sql))
+    _add_to_breakdown("sql", seconds)
+
+def observe_algod(operation: str, outcome: str, seconds: float):
+    algod_request_seconds.observe(seconds, operation, outcome)
+    _add_to_breakdown("algod", seconds)
+
+def observe_render(template: str, seconds: float):
+    template_render_seconds.observe(seconds, template)
+    _add_to_breakdown("render", seconds)
+
+def timed_job(name: str, fn: Callable):
+    def run(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            scheduler_job_seconds.observe(time.perf_counter() - started, name, outcome)
+    run.__name__ = getattr(fn, "__name__", name)
+    return run
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_breakdown = start_request_breakdown()
+
+    @app.after_request
+    def record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        status = g.pop("_metrics_status", 500 if exc else 200)
+        http_request_seconds.observe(seconds, request.method, route, status)
+        finish_request_breakdown(g.pop("_metrics_breakdown"), f"{request.method} {route} {status}", seconds)
+
+    def render_started(sender, template, context, **extra):
+        g._metrics_render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        started = g.pop("_metrics_render_started", None)
+        if started is not None:
+            observe_render(template.name or "<string>", time.perf_counter() - started)
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in (http_request_seconds, sql_statement_seconds, algod_request_seconds, algod_confirmation_seconds,
+                   template_render_seconds, scheduler_job_seconds, swallowed_exceptions):
+        lines.extend(metric.render())
+    for name, fn in sorted(_collectors.items()):
+        gauge = f"{METRICS_PREFIX}{name}"
+        try:
+            stats = fn()
+        except Exception as e:
+            count_swallowed("metrics_collector", e)
+            continue
+        lines.append(f"# TYPE {gauge} gauge")
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{gauge}{{stat="{_escape(key)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def metrics_authorized(authorization: str | None) -> bool:
+    scheme, _, token = (authorization or "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from algosdk.error import AlgodHTTPError, TransactionRejectedError
+
+from models import db, record_company_price
+from services.algorand import (
+    create_asa, deploy_price_app, find_created_asset, find_created_price_app,
+    pending_info, track_confirmation, warm_program_cache
+)
+from services.metrics import count_swallowed
+from services.signers import signer_for
+from services.valuation import compute_token_price_scaled_gbp
+
+ONBOARDING_MAX_ATTEMPTS = int(os.environ.get("ONBOARDING_MAX_ATTEMPTS", "3"))
+# A pipeline that has not advanced for this long belongs to a process that died mid-onboarding.
+ONBOARDING_STALE_SECONDS = int(os.environ.get("ONBOARDING_STALE_SECONDS", "120"))
+IN_PROGRESS_STATUSES = ("queued", "asset_created")
+
+def start_onboarding(company_id: int) -> bool:
+    # The claim lives on the companies row, so only one process runs a pipeline; a claim left by a
+    # process that died is taken over once the pipeline has been idle for ONBOARDING_STALE_SECONDS.
+    claim = uuid.uuid4().hex
+    conn = db()
+    claimed = conn.execute(f"""
+        UPDATE companies SET onboarding_claim=?, onboarding_updated_at=CURRENT_TIMESTAMP
+        WHERE id=? AND onboarding_status IN ({",".join("?" * len(IN_PROGRESS_STATUSES))})
+          AND (onboarding_claim IS NULL OR onboarding_updated_at < datetime('now', ?))
+        RETURNING id
+    """, (claim, company_id, *IN_PROGRESS_STATUSES, f"-{ONBOARDING_STALE_SECONDS} seconds")).fetchone()
+    conn.commit()
+    conn.close()
+    if claimed is None:
+        return False
+    threading.Thread(target=_run, args=(company_id, claim), name=f"onboarding-{company_id}", daemon=True).start()
+    return True
+
+def resume_stale_onboarding():
+    conn = db()
+    rows = conn.execute(f"""
+        SELECT id FROM companies
+        WHERE onboarding_status IN ({",".join("?" * len(IN_PROGRESS_STATUSES))})
+          AND onboarding_updated_at < datetime('now', ?)
+    """, (*IN_PROGRESS_STATUSES, f"-{ONBOARDING_STALE_SECONDS} seconds")).fetchall()
+    conn.close()
+    for row in rows:
+        start_onboarding(row["id"])
+
+def onboarding_status(company_id: int):
+    conn = db()
+    row = conn.execute("""
+        SELECT onboarding_status, asset_id, app_id, onboarding_error FROM companies WHERE id=?
+    """, (company_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return dict(status=row["onboarding_status"], asset_id=row["asset_id"], app_id=row["app_id"],
+                error=row["onboarding_error"], done=row["onboarding_status"] == "app_deployed")
+
+def _run(company_id: int, claim: str):
+    try:
+        for attempt in range(1, ONBOARDING_MAX_ATTEMPTS + 1):
+            try:
+                _advance(company_id)
+                return
+            except Exception as e:
+                count_swallowed("onboarding", e)
+                print(f"Onboarding attempt {attempt} failed for company {company_id}:", e)
+                if attempt == ONBOARDING_MAX_ATTEMPTS:
+                    _update(company_id, onboarding_status="failed", onboarding_error=str(e))
+                else:
+                    _update(company_id, onboarding_error=str(e))
+                    time.sleep(2 ** attempt)
+    finally:
+        conn = db()
+        conn.execute("UPDATE companies SET onboarding_claim=NULL WHERE id=? AND onboarding_claim=?", (company_id, claim))
+        conn.commit()
+        conn.close()
+
+def _advance(company_id: int):
+    conn = db()
+    comp = conn.execute("SELECT * FROM companies WHERE id=?", (company_id,)).fetchone()
+    user = conn.execute("SELECT algo_addr, algo_mnemonic FROM users WHERE id=?", (comp["user_id"],)).fetchone()
+    conn.close()
+    if comp["app_id"] is not None:
+        return
+    company = signer_for(user["algo_mnemonic"])
+
+    # Compiling the price app and computing its initial price only need the form values,
+    # so they run while the ASA confirmation is pending.
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="onboarding-prep") as pool:
+        compiled = pool.submit(warm_program_cache)
+        price = pool.submit(compute_token_price_scaled_gbp, comp["name"], comp["supply"], comp["equity_pct"],
+                            valuation_override_gbp=comp["valuation_gbp"])
+
+        asset_id = comp["asset_id"]
+        if asset_id is None:
+            asset_id = _confirmed_result(comp["asset_txid"], "asset-index") if comp["asset_txid"] else None
+            if asset_id is None and comp["asset_txid"]:
+                asset_id = find_created_asset(user["algo_addr"], comp["unit_name"], comp["asset_name"])
+            if asset_id is None:
+                asset_id = create_asa(company, comp["unit_name"], comp["asset_name"], comp["supply"], decimals=0,
+                                      on_submitted=lambda txid: _update(company_id, asset_txid=txid))
+            _update(company_id, asset_id=asset_id, onboarding_status="asset_created", onboarding_error=None)
+
+        compiled.result()
+        initial_price_scaled = price.result()
+
+    app_id = _confirmed_result(comp["app_txid"], "application-index") if comp["app_txid"] else None
+    if app_id is None and comp["app_txid"]:
+        app_id = find_created_price_app(user["algo_addr"], asset_id)
+    if app_id is None:
+        app_id = deploy_price_app(company, asset_id, initial_price_scaled,
+                                  on_submitted=lambda txid: _update(company_id, app_txid=txid))
+    _update(company_id, app_id=app_id, onboarding_status="app_deployed", onboarding_error=None)
+    conn = db()
+    record_company_price(conn, company_id)
+    conn.commit()
+    conn.close()
+
+def _confirmed_result(txid: str, field: str):
+    # Waits out a transaction that is still in the pool; None means it is gone or was rejected. A wait that
+    # times out raises, so the attempt is retried rather than sending a second create for a live transaction.
+    try:
+        info = pending_info(txid)
+    except AlgodHTTPError:
+        return None
+    if info.get("pool-error"):
+        return None
+    if not info.get("confirmed-round"):
+        try:
+            info = track_confirmation(txid).result()
+        except TransactionRejectedError:
+            return None
+    return info.get(field)
+
+def _update(company_id: int, **fields):
+    assignments = ", ".join(f"{k}=?" for k in fields)
+    conn = db()
+    conn.execute(f"UPDATE companies SET {assignments}, onboarding_updated_at=CURRENT_TIMESTAMP WHERE id=?",
+                 (*fields.values(), company_id))
+    conn.commit()
+    conn.close()
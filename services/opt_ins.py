@@ -0,0 +1,77 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db
+from services.algorand import ensure_opt_in, is_opted_in
+from services.metrics import count_swallowed
+from services.signers import signer_for
+
+OPT_IN_WORKERS = int(os.environ.get("OPT_IN_WORKERS", "4"))
+# Pairs share a fixed set of locks by hash; a collision only serialises two unrelated opt-ins.
+OPT_IN_LOCK_STRIPES = 64
+
+_key_locks = [threading.Lock() for _ in range(OPT_IN_LOCK_STRIPES)]
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "chain_checks": 0, "submitted": 0, "errors": 0}
+_pool = ThreadPoolExecutor(max_workers=OPT_IN_WORKERS, thread_name_prefix="opt-in")
+
+def _lock_for(developer_id: int, asset_id: int) -> threading.Lock:
+    return _key_locks[hash((developer_id, asset_id)) % OPT_IN_LOCK_STRIPES]
+
+def _count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+def ensure_developer_opt_in(developer_id: int, addr: str, mnemonic_: str, asset_id: int):
+    # The SQLite row is authoritative once written; algod is only asked on a miss.
+    conn = db()
+    row = conn.execute("SELECT 1 FROM asset_opt_ins WHERE developer_id=? AND asset_id=?",
+                       (developer_id, asset_id)).fetchone()
+    conn.close()
+    if row:
+        _count("hits")
+        return
+    # Pickup and settlement may race for the same pair; only one of them submits.
+    with _lock_for(developer_id, asset_id):
+        conn = db()
+        row = conn.execute("SELECT 1 FROM asset_opt_ins WHERE developer_id=? AND asset_id=?",
+                           (developer_id, asset_id)).fetchone()
+        conn.close()
+        if row:
+            _count("hits")
+            return
+        _count("chain_checks")
+        txid = None
+        if not is_opted_in(addr, asset_id):
+            _count("submitted")
+            txid = ensure_opt_in(signer_for(mnemonic_), asset_id)
+        conn = db()
+        conn.execute("INSERT OR IGNORE INTO asset_opt_ins(developer_id, asset_id, txid) VALUES(?,?,?)",
+                     (developer_id, asset_id, txid))
+        conn.commit()
+        conn.close()
+
+def _opt_in_for_job(job_id: int):
+    conn = db()
+    row = conn.execute("""
+        SELECT j.developer_id, d.algo_addr, d.algo_mnemonic, c.asset_id
+        FROM jobs j JOIN users d ON d.id = j.developer_id JOIN companies c ON c.id = j.company_id
+        WHERE j.id=?
+    """, (job_id,)).fetchone()
+    conn.close()
+    if not row or row["asset_id"] is None:
+        return
+    try:
+        ensure_developer_opt_in(row["developer_id"], row["algo_addr"], row["algo_mnemonic"], row["asset_id"])
+    except Exception as e:
+        count_swallowed("opt_in", e)
+        _count("errors")
+        print("Opt-in warning:", e)
+
+def opt_in_for_job_async(job_id: int):
+    _pool.submit(_opt_in_for_job, job_id)
+
+def opt_in_stats():
+    with _stats_lock:
+        return dict(_stats)
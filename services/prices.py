@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from models import db, record_token_price
+from services.algorand import current_round, get_app_states, update_token_price
+from services.metrics import count_swallowed
+from services.signers import signer_for
+from services.valuation import company_prices_scaled_gbp
+
+PRICE_REFRESH_WORKERS = int(os.environ.get("PRICE_REFRESH_WORKERS", "8"))
+PRICE_REFRESH_RETRIES = int(os.environ.get("PRICE_REFRESH_RETRIES", "2"))
+
+def reconcile_token_prices() -> Dict[str, int]:
+    conn = db()
+    rows = conn.execute("""
+        SELECT c.app_id, tp.price_scaled
+        FROM companies c LEFT JOIN token_prices tp ON tp.app_id = c.app_id
+        WHERE c.app_id IS NOT NULL
+    """).fetchall()
+    conn.close()
+
+    summary = {"checked": 0, "corrected": 0, "unavailable": 0}
+    if not rows:
+        return summary
+    # State read after this round is at least as new as the round itself.
+    round_ = current_round()
+    states = get_app_states(row["app_id"] for row in rows)
+    for row in rows:
+        summary["checked"] += 1
+        chain_price = states.get(row["app_id"], {}).get("token_price")
+        if chain_price is None:
+            summary["unavailable"] += 1
+            continue
+        if chain_price != row["price_scaled"]:
+            record_token_price(row["app_id"], chain_price, round_)
+            summary["corrected"] += 1
+    return summary
+
+def refresh_all_prices() -> Dict[str, float]:
+    started = time.monotonic()
+    conn = db()
+    companies = conn.execute("""
+        SELECT c.id, c.name, c.app_id, c.supply, c.equity_pct, c.valuation_gbp,
+               u.algo_mnemonic, tp.price_scaled AS last_price
+        FROM companies c
+        JOIN users u ON u.id = c.user_id
+        LEFT JOIN token_prices tp ON tp.app_id = c.app_id
+        WHERE c.app_id IS NOT NULL AND c.name <> ''
+    """).fetchall()
+    conn.close()
+
+    summary = {"updated": 0, "skipped": 0, "failed": 0}
+    pending = []
+    for comp, new_price_scaled in zip(companies, company_prices_scaled_gbp(companies).tolist()):
+        if new_price_scaled == comp["last_price"]:
+            summary["skipped"] += 1
+        else:
+            pending.append((comp, new_price_scaled))
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=PRICE_REFRESH_WORKERS, thread_name_prefix="price-refresh") as pool:
+            for ok in pool.map(lambda item: _update_price_with_retry(*item), pending):
+                summary["updated" if ok else "failed"] += 1
+    summary["duration_seconds"] = round(time.monotonic() - started, 3)
+    print("Price refresh:", summary)
+    return summary
+
+def _update_price_with_retry(comp, new_price_scaled: int) -> bool:
+    company = signer_for(comp["algo_mnemonic"])
+    for attempt in range(PRICE_REFRESH_RETRIES + 1):
+        try:
+            update_token_price(company, comp["app_id"], new_price_scaled)
+            return True
+        except Exception as e:
+            count_swallowed("price_update", e)
+            if attempt == PRICE_REFRESH_RETRIES:
+                print(f"Price update failed for company {comp['id']}:", e)
+                return False
+            time.sleep(0.5 * 2 ** attempt)
@@ -0,0 +1,64 @@
+import atexit
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from models import db, prune_events
+from services.metrics import timed_job
+from services.onboarding import resume_stale_onboarding
+from services.prices import reconcile_token_prices, refresh_all_prices
+from services.wallet_pool import refill_wallet_pool
+
+LEASE_NAME = "periodic-jobs"
+LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", "60"))
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def try_acquire_lease(name: str = LEASE_NAME, owner: str = LEASE_OWNER, ttl: int = LEASE_SECONDS) -> bool:
+    # Takes the lease if it is free or expired, and renews it if this owner already holds it.
+    now = time.time()
+    conn = db()
+    try:
+        conn.execute("""
+            INSERT INTO scheduler_leases(name, owner, expires_at) VALUES(?,?,?)
+            ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+            WHERE scheduler_leases.owner = excluded.owner OR scheduler_leases.expires_at < ?
+        """, (name, owner, now + ttl, now))
+        conn.commit()
+        row = conn.execute("SELECT owner FROM scheduler_leases WHERE name=?", (name,)).fetchone()
+        return row is not None and row["owner"] == owner
+    finally:
+        conn.close()
+
+def release_lease(name: str = LEASE_NAME, owner: str = LEASE_OWNER):
+    conn = db()
+    conn.execute("DELETE FROM scheduler_leases WHERE name=? AND owner=?", (name, owner))
+    conn.commit()
+    conn.close()
+
+def leader_only(fn):
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        if not try_acquire_lease():
+            return None
+        return fn(*args, **kwargs)
+    return inner
+
+def _add_leader_job(scheduler, job_id: str, fn, run_now: bool = False, **interval):
+    if run_now:
+        interval["next_run_time"] = datetime.now()
+    scheduler.add_job(leader_only(timed_job(job_id, fn)), "interval", id=job_id, replace_existing=True, **interval)
+
+def add_periodic_jobs(scheduler):
+    # Every process may schedule these; only the lease holder actually runs them.
+    scheduler.add_job(try_acquire_lease, "interval", seconds=max(1, LEASE_SECONDS // 3), id="scheduler_lease",
+                      next_run_time=datetime.now(), replace_existing=True)
+    _add_leader_job(scheduler, "price_updater", refresh_all_prices, minutes=5)
+    _add_leader_job(scheduler, "price_reconciler", reconcile_token_prices, run_now=True, minutes=1)
+    _add_leader_job(scheduler, "wallet_pool_refill", refill_wallet_pool, run_now=True, seconds=30)
+    _add_leader_job(scheduler, "onboarding_resume", resume_stale_onboarding, minutes=1)
+    _add_leader_job(scheduler, "event_prune", prune_events, minutes=1)
+    atexit.register(release_lease)
+    return scheduler
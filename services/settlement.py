@@ -0,0 +1,335 @@
+import os
+import threading
+import time
+import uuid
+
+from algosdk.error import AlgodHTTPError
+
+from models import db, record_job_transition, record_tokens_issued, register_hot_query
+from models import record_token_price
+from services.algorand import (
+    atomic_approve_and_pay_batch, current_round, find_confirmed_round, get_app_state,
+    pending_info, PAYOUTS_PER_GROUP
+)
+from services.metrics import count_swallowed
+from services.opt_ins import ensure_developer_opt_in
+from services.signers import signer_for
+from services.valuation import compute_token_price_scaled_gbp
+
+SETTLEMENT_WORKERS = int(os.environ.get("SETTLEMENT_WORKERS", "2"))
+SETTLEMENT_MAX_ATTEMPTS = int(os.environ.get("SETTLEMENT_MAX_ATTEMPTS", "3"))
+SETTLEMENT_POLL_SECONDS = float(os.environ.get("SETTLEMENT_POLL_SECONDS", "2"))
+# A row left in 'submitting' this long belongs to a worker that died mid-settlement. Live workers refresh
+# updated_at between opt-in waits and right before submitting, so this must exceed one confirmation wait.
+SETTLEMENT_STALE_SECONDS = int(os.environ.get("SETTLEMENT_STALE_SECONDS", "120"))
+UPFRONT_MICROALGOS = 500_000
+
+_wakeup = threading.Event()
+_workers: list[threading.Thread] = []
+
+def enqueue_settlement(conn, job_id: int, company_id: int) -> bool:
+    # Runs inside the caller's transaction; the caller commits and then wakes the workers.
+    cur = conn.execute(
+        "UPDATE jobs SET status='settling' WHERE id=? AND company_id=? AND status='awaiting_verification'",
+        (job_id, company_id)
+    )
+    if cur.rowcount != 1:
+        return False
+    record_job_transition(conn, job_id, "awaiting_verification", "settling")
+    conn.execute("""
+        INSERT INTO settlements(job_id, company_id) VALUES(?,?)
+        ON CONFLICT(job_id) DO UPDATE SET
+          status='queued', attempts=0, available_at=0, claim=NULL, txid=NULL, first_valid=NULL, last_valid=NULL,
+          needs_review=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP
+    """, (job_id, company_id))
+    return True
+
+def wake_settlement_workers():
+    _wakeup.set()
+
+def start_settlement_workers(count: int = SETTLEMENT_WORKERS):
+    if _workers:
+        return
+    for i in range(count):
+        t = threading.Thread(target=_worker_loop, name=f"settlement-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+
+def _worker_loop():
+    while True:
+        try:
+            batch = _claim_next()
+            if not batch:
+                _recover_stale()
+                _wakeup.wait(SETTLEMENT_POLL_SECONDS)
+                _wakeup.clear()
+                continue
+            _process(batch)
+        except Exception as e:
+            count_swallowed("settlement_worker", e)
+            print("Settlement worker error:", e)
+            time.sleep(SETTLEMENT_POLL_SECONDS)
+
+def _claim_next():
+    # Claims up to one atomic group's worth of queued settlements, all for the same company. The claim token
+    # is checked before submitting and on every later write, so a worker whose rows were recovered stops.
+    conn = db()
+    try:
+        rows = _claim_rows(conn)
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+def _claim_rows(conn):
+    now = time.time()
+    return conn.execute("""
+        UPDATE settlements
+        SET status='submitting', attempts=attempts+1, claim=?, txid=NULL, updated_at=CURRENT_TIMESTAMP
+        WHERE id IN (
+          SELECT id FROM settlements
+          WHERE status='queued' AND available_at <= ? AND company_id = (
+            SELECT company_id FROM settlements WHERE status='queued' AND available_at <= ? ORDER BY id LIMIT 1
+          )
+          ORDER BY id LIMIT ?
+        )
+        RETURNING id, job_id, company_id, attempts, claim
+    """, (uuid.uuid4().hex, now, now, PAYOUTS_PER_GROUP)).fetchall()
+
+register_hot_query("settlement_claim", _claim_rows)
+
+def _process(batch):
+    ids = [s["id"] for s in batch]
+    claim = batch[0]["claim"]
+    marks = ",".join("?" * len(ids))
+    conn = db()
+    comp = conn.execute("SELECT * FROM companies WHERE id=?", (batch[0]["company_id"],)).fetchone()
+    company_user = conn.execute("SELECT * FROM users WHERE id=?", (comp["user_id"],)).fetchone()
+    rows = conn.execute(f"""
+        SELECT s.id AS settlement_id, j.token_amount, j.developer_id,
+               d.algo_addr AS dev_addr, d.algo_mnemonic AS dev_mnemonic
+        FROM settlements s JOIN jobs j ON j.id = s.job_id JOIN users d ON d.id = j.developer_id
+        WHERE s.id IN ({marks}) ORDER BY s.id
+    """, ids).fetchall()
+    conn.close()
+
+    submitted = []
+    def on_submitted(_group, txid, first_valid, last_valid):
+        submitted.append(txid)
+        _set_txid(ids, claim, txid, first_valid, last_valid)
+
+    try:
+        # Usually a cache hit: the opt-in was issued when the task was picked up.
+        for r in {r["developer_id"]: r for r in rows}.values():
+            ensure_developer_opt_in(r["developer_id"], r["dev_addr"], r["dev_mnemonic"], comp["asset_id"])
+            if not _still_claimed(ids, claim):
+                print(f"Settlements {ids} were recovered by another worker; not submitting.")
+                return
+
+        new_price_scaled = compute_token_price_scaled_gbp(
+            comp["name"], comp["supply"], comp["equity_pct"], valuation_override_gbp=comp["valuation_gbp"]
+        )
+        if not _still_claimed(ids, claim):
+            print(f"Settlements {ids} were recovered by another worker; not submitting.")
+            return
+        txids, confirmed_round = atomic_approve_and_pay_batch(
+            signer_for(company_user["algo_mnemonic"]),
+            comp["app_id"], comp["asset_id"],
+            [(r["dev_addr"], UPFRONT_MICROALGOS, r["token_amount"]) for r in rows],
+            new_price_scaled, on_submitted=on_submitted
+        )
+    except Exception as e:
+        count_swallowed("settlement_submit", e)
+        for s in batch:
+            if submitted:
+                # The group reached the network; only the stale sweep may decide its outcome.
+                _record_error(s["id"], e)
+            else:
+                _retry_or_fail(s, e)
+        return
+    _finalize(ids, txids[0], comp["app_id"], new_price_scaled, confirmed_round)
+
+def _still_claimed(settlement_ids, claim: str) -> bool:
+    # Compare-and-set on the claim token; refreshing updated_at also keeps the stale sweep away.
+    marks = ",".join("?" * len(settlement_ids))
+    conn = db()
+    cur = conn.execute(f"""
+        UPDATE settlements SET updated_at=CURRENT_TIMESTAMP
+        WHERE id IN ({marks}) AND claim=? AND status='submitting'
+    """, (*settlement_ids, claim))
+    conn.commit()
+    conn.close()
+    return cur.rowcount == len(settlement_ids)
+
+def _set_txid(settlement_ids, claim: str, txid: str, first_valid: int, last_valid: int):
+    marks = ",".join("?" * len(settlement_ids))
+    conn = db()
+    conn.execute(f"""
+        UPDATE settlements SET txid=?, first_valid=?, last_valid=?, updated_at=CURRENT_TIMESTAMP
+        WHERE id IN ({marks}) AND claim=?
+    """, (txid, first_valid, last_valid, *settlement_ids, claim))
+    conn.commit()
+    conn.close()
+
+def _record_error(settlement_id: int, error):
+    conn = db()
+    conn.execute("UPDATE settlements SET last_error=? WHERE id=?", (str(error), settlement_id))
+    conn.commit()
+    conn.close()
+
+def _finalize(settlement_ids, txid: str, app_id: int, price_scaled: int, confirmed_round: int):
+    # Shared by the worker and stale recovery. The group's price update is recorded first, so the
+    # holdings credited below are valued at it; then every job it paid is closed in one transaction.
+    record_token_price(app_id, price_scaled, confirmed_round)
+    conn = db()
+    try:
+        for settlement_id in settlement_ids:
+            cur = conn.execute("""
+                UPDATE settlements SET status='confirmed', txid=?, last_error=NULL, updated_at=CURRENT_TIMESTAMP
+                WHERE id=? AND status='submitting'
+            """, (txid, settlement_id))
+            if cur.rowcount != 1:
+                continue
+            job = conn.execute("""
+                SELECT j.id, j.developer_id, j.company_id, j.token_amount, c.asset_id
+                FROM settlements s JOIN jobs j ON j.id = s.job_id JOIN companies c ON c.id = j.company_id
+                WHERE s.id=?
+            """, (settlement_id,)).fetchone()
+            conn.execute("""
+                INSERT INTO developer_holdings(developer_id, company_id, asset_id, tokens_held)
+                VALUES(?,?,?,?)
+                ON CONFLICT(developer_id, company_id, asset_id) DO UPDATE SET
+                  tokens_held=tokens_held+excluded.tokens_held, updated_at=CURRENT_TIMESTAMP
+            """, (job["developer_id"], job["company_id"], job["asset_id"], job["token_amount"]))
+            conn.execute("UPDATE jobs SET status='closed' WHERE id=?", (job["id"],))
+            record_job_transition(conn, job["id"], "settling", "closed")
+            record_tokens_issued(conn, job["developer_id"], job["company_id"], job["token_amount"])
+        conn.commit()
+    finally:
+        conn.close()
+
+def _retry_or_fail(settlement, error, stale: bool = False):
+    # Only the claim holder may requeue a row; with stale=True the row must also still be stale, so a
+    # worker that refreshed it after the sweep read it keeps it.
+    guard, params = "id=? AND claim IS ? AND status='submitting'", [settlement["id"], settlement["claim"]]
+    if stale:
+        guard += " AND updated_at < datetime('now', ?)"
+        params.append(f"-{SETTLEMENT_STALE_SECONDS} seconds")
+    conn = db()
+    try:
+        if settlement["attempts"] < SETTLEMENT_MAX_ATTEMPTS:
+            conn.execute(f"""
+                UPDATE settlements SET status='queued', available_at=?, last_error=?, updated_at=CURRENT_TIMESTAMP
+                WHERE {guard}
+            """, (time.time() + 2 ** settlement["attempts"], str(error), *params))
+        else:
+            cur = conn.execute(f"""
+                UPDATE settlements SET status='failed', last_error=?, updated_at=CURRENT_TIMESTAMP WHERE {guard}
+            """, (str(error), *params))
+            if cur.rowcount == 1:
+                _reopen_job(conn, settlement["id"])
+        conn.commit()
+    finally:
+        conn.close()
+
+def _needs_review(settlement, message: str):
+    # The payout may have reached the chain, so the job stays in 'settling' until resolve_settlement() is run.
+    conn = db()
+    conn.execute("""
+        UPDATE settlements SET status='failed', needs_review=1, last_error=?, updated_at=CURRENT_TIMESTAMP
+        WHERE id=? AND claim IS ? AND status='submitting'
+    """, (message, settlement["id"], settlement["claim"]))
+    conn.commit()
+    conn.close()
+
+def _reopen_job(conn, settlement_id: int):
+    # Hand the job back to the company so it can be verified again.
+    job = conn.execute("""
+        UPDATE jobs SET status='awaiting_verification'
+        WHERE id=(SELECT job_id FROM settlements WHERE id=?) AND status='settling'
+        RETURNING id
+    """, (settlement_id,)).fetchone()
+    if job:
+        record_job_transition(conn, job["id"], "settling", "awaiting_verification")
+
+def _recover_stale():
+    conn = db()
+    rows = conn.execute("""
+        SELECT * FROM settlements
+        WHERE status='submitting' AND updated_at < datetime('now', ?)
+    """, (f"-{SETTLEMENT_STALE_SECONDS} seconds",)).fetchall()
+    conn.close()
+    for s in rows:
+        if not s["txid"]:
+            _retry_or_fail(s, s["last_error"] or "Worker stopped before submitting", stale=True)
+            continue
+        try:
+            info = pending_info(s["txid"])
+        except AlgodHTTPError:
+            info = None
+        if info and info.get("confirmed-round"):
+            _finalize_recovered(s, info["confirmed-round"])
+        elif info and info.get("pool-error"):
+            _retry_or_fail(s, info["pool-error"])
+        elif info is None:
+            # algod forgets pending info a few rounds after confirmation, so a 404 proves nothing.
+            _check_chain(s)
+
+def _check_chain(settlement):
+    txid = settlement["txid"]
+    if settlement["last_valid"] is None:
+        _needs_review(settlement, f"Outcome of {txid} is unknown; check the chain before settling again.")
+        return
+    try:
+        if current_round() <= settlement["last_valid"]:
+            return  # Still inside its validity window; the next sweep looks again.
+        confirmed_round = find_confirmed_round(txid, settlement["first_valid"], settlement["last_valid"])
+    except AlgodHTTPError as e:
+        count_swallowed("settlement_chain_check", e)
+        _needs_review(settlement, f"Could not scan rounds for {txid} ({e}); check the chain before settling again.")
+        return
+    if confirmed_round is not None:
+        _finalize_recovered(settlement, confirmed_round)
+    else:
+        # The window has closed without the group, so it can never confirm and a retry cannot pay twice.
+        _retry_or_fail(settlement, f"{txid} expired at round {settlement['last_valid']} without confirming")
+
+def _finalize_recovered(settlement, confirmed_round: int):
+    conn = db()
+    app_id = conn.execute("SELECT app_id FROM companies WHERE id=?", (settlement["company_id"],)).fetchone()["app_id"]
+    conn.close()
+    _finalize([settlement["id"]], settlement["txid"], app_id, get_app_state(app_id)["token_price"], confirmed_round)
+
+def settlements_needing_review():
+    conn = db()
+    rows = conn.execute("""
+        SELECT s.id, s.job_id, s.txid, s.first_valid, s.last_valid, s.last_error, s.updated_at
+        FROM settlements s WHERE s.needs_review=1 ORDER BY s.id
+    """).fetchall()
+    conn.close()
+    return rows
+
+def resolve_settlement(settlement_id: int, confirmed_round: int | None) -> bool:
+    # Run once someone has checked the chain for a held settlement's txid. A confirmed round finalizes
+    # it as if the worker had seen the confirmation; None hands the job back for verification.
+    conn = db()
+    try:
+        if confirmed_round is None:
+            row = conn.execute("""
+                UPDATE settlements SET needs_review=0, updated_at=CURRENT_TIMESTAMP
+                WHERE id=? AND needs_review=1 AND status='failed' RETURNING id
+            """, (settlement_id,)).fetchone()
+            if row:
+                _reopen_job(conn, settlement_id)
+        else:
+            # Moved back to 'submitting' under a fresh claim, which the stale sweep leaves alone until it ages.
+            row = conn.execute("""
+                UPDATE settlements SET status='submitting', needs_review=0, claim=?, updated_at=CURRENT_TIMESTAMP
+                WHERE id=? AND needs_review=1 AND status='failed' RETURNING *
+            """, (uuid.uuid4().hex, settlement_id)).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    if row and confirmed_round is not None:
+        _finalize_recovered(row, confirmed_round)
+    return row is not None
@@ -0,0 +1,64 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+from algosdk import account, mnemonic
+
+SIGNER_CACHE_SIZE = int(os.environ.get("SIGNER_CACHE_SIZE", "1024"))
+
+class Signer:
+    __slots__ = ("sk", "addr")
+
+    def __init__(self, sk: bytes, addr: str | None = None):
+        self.sk = sk
+        self.addr = addr or account.address_from_private_key(sk)
+
+    def sign(self, txn):
+        return txn.sign(self.sk)
+
+    def __repr__(self):
+        return f"Signer({self.addr})"
+
+class SignerRegistry:
+    # Decoding a 25-word mnemonic and deriving its address is pure CPU work repeated on every
+    # price refresh and settlement; decoded signers are kept here, least recently used evicted first.
+    # Entries are keyed by the mnemonic itself, so a rewritten wallet can never be served a stale key.
+
+    def __init__(self, max_size: int = SIGNER_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._signers: "OrderedDict[str, Signer]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, mnemonic_: str) -> Signer:
+        with self._lock:
+            signer = self._signers.get(mnemonic_)
+            if signer is not None:
+                self._signers.move_to_end(mnemonic_)
+                self.stats["hits"] += 1
+                return signer
+        signer = Signer(mnemonic.to_private_key(mnemonic_))
+        with self._lock:
+            self.stats["misses"] += 1
+            self._signers[mnemonic_] = signer
+            while len(self._signers) > self.max_size:
+                self._signers.popitem(last=False)
+                self.stats["evictions"] += 1
+        return signer
+
+    def clear(self):
+        with self._lock:
+            self._signers.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, size=len(self._signers))
+
+signer_registry = SignerRegistry()
+
+def signer_for(mnemonic_: str) -> Signer:
+    return signer_registry.get(mnemonic_)
+
+def signer_cache_stats() -> Dict[str, int]:
+    return signer_registry.snapshot()
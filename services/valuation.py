@@ -1,5 +1,7 @@
 import random
 
+import numpy as np
+
 SCALE_GBP = 100
 
 def fetch_company_valuation_gbp(company_name: str) -> float:
@@ -11,3 +13,71 @@ def compute_token_price_scaled_gbp(company_name: str, supply: int, equity_pct: f
     valuation_gbp = valuation_override_gbp if valuation_override_gbp is not None else fetch_company_valuation_gbp(company_name)
     per_token_gbp = (valuation_gbp * equity_pct) / max(1, supply)
     return int(round(per_token_gbp * SCALE_GBP))
+
+def compute_token_prices_scaled_gbp(valuations_gbp, equity_pcts, supplies) -> np.ndarray:
+    # Same float64 operations in the same order as compute_token_price_scaled_gbp, and np.rint
+    # rounds half to even like round(), so each element matches the scalar result exactly.
+    valuations = np.asarray(valuations_gbp, dtype=np.float64)
+    equity = np.asarray(equity_pcts, dtype=np.float64)
+    supply = np.maximum(np.asarray(supplies, dtype=np.int64), 1)
+    per_token_gbp = (valuations * equity) / supply
+    return np.rint(per_token_gbp * SCALE_GBP).astype(np.int64)
+
+def company_prices_scaled_gbp(companies) -> np.ndarray:
+    # companies are rows with name, supply, equity_pct and valuation_gbp; a NULL valuation is fetched.
+    valuations = [c["valuation_gbp"] if c["valuation_gbp"] is not None else fetch_company_valuation_gbp(c["name"])
+                  for c in companies]
+    return compute_token_prices_scaled_gbp(valuations, [c["equity_pct"] for c in companies],
+                                           [c["supply"] for c in companies])
+
+def portfolio_values_scaled(owner_ids, prices_scaled, tokens_held) -> dict[int, int]:
+    # One (owner, price, tokens) triple per holding; returns each owner's total value, summed in int64
+    # so it matches the per-holding sum exactly.
+    owners = np.asarray(owner_ids, dtype=np.int64)
+    if not len(owners):
+        return {}
+    values = np.asarray(prices_scaled, dtype=np.int64) * np.asarray(tokens_held, dtype=np.int64)
+    unique, index = np.unique(owners, return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, index, values)
+    return dict(zip(unique.tolist(), totals.tolist()))
+
+def cap_tables(conn, company_ids: list[int] | None = None) -> dict[int, dict]:
+    # Tokens issued through closed jobs against supply, and each holder's share, for many companies at once.
+    where, args = "", ()
+    if company_ids is not None:
+        if not company_ids:
+            return {}
+        where, args = f"WHERE c.id IN ({','.join('?' * len(company_ids))})", tuple(company_ids)
+    companies = conn.execute(f"""
+        SELECT c.id, COALESCE(c.supply, 0) AS supply,
+               (SELECT COALESCE(SUM(j.token_amount), 0) FROM jobs j
+                WHERE j.company_id = c.id AND j.status = 'closed') AS issued
+        FROM companies c {where} ORDER BY c.id
+    """, args).fetchall()
+    if not companies:
+        return {}
+    holdings = conn.execute(f"""
+        SELECT dh.company_id, dh.developer_id, SUM(dh.tokens_held) AS tokens
+        FROM developer_holdings dh JOIN companies c ON c.id = dh.company_id {where}
+        GROUP BY dh.company_id, dh.developer_id ORDER BY dh.company_id, tokens DESC
+    """, args).fetchall()
+
+    ids = np.array([c["id"] for c in companies], dtype=np.int64)
+    supply = np.array([c["supply"] for c in companies], dtype=np.int64)
+    issued = np.array([c["issued"] for c in companies], dtype=np.int64)
+    issued_pct = np.divide(issued * 100.0, supply, out=np.zeros(len(ids)), where=supply > 0)
+
+    out = {}
+    for i, company_id in enumerate(ids.tolist()):
+        out[company_id] = dict(supply=int(supply[i]), issued=int(issued[i]),
+                               remaining=int(supply[i] - issued[i]), issued_pct=float(issued_pct[i]), holders=[])
+    if holdings:
+        holder_company = np.array([h["company_id"] for h in holdings], dtype=np.int64)
+        holder_tokens = np.array([h["tokens"] for h in holdings], dtype=np.int64)
+        holder_supply = supply[np.searchsorted(ids, holder_company)]
+        holder_pct = np.divide(holder_tokens * 100.0, holder_supply, out=np.zeros(len(holdings)),
+                               where=holder_supply > 0)
+        for h, pct in zip(holdings, holder_pct.tolist()):
+            out[h["company_id"]]["holders"].append(dict(developer_id=h["developer_id"], tokens=h["tokens"], pct=pct))
+    return out
@@ -0,0 +1,178 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from algosdk.error import AlgodHTTPError
+
+from models import db
+from services.algorand import account_balance, generate_wallet, fund_accounts_batch, pending_info, MAX_GROUP_SIZE
+from services.metrics import count_swallowed
+
+WALLET_POOL_TARGET = int(os.environ.get("WALLET_POOL_TARGET", "32"))
+WALLET_FUND_MICROALGOS = 10_000_000
+# A wallet left in 'funding' this long belongs to a refill that died before recording the result.
+WALLET_FUNDING_STALE_SECONDS = int(os.environ.get("WALLET_FUNDING_STALE_SECONDS", "120"))
+
+_funding_lock = threading.Lock()
+_funding_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wallet-funding")
+_pass_queued_lock = threading.Lock()
+_pass_queued = False
+
+def claim_wallet(conn):
+    # Runs inside the caller's transaction, so a failed registration puts the wallet back. The mnemonic
+    # moves to the users row; the pool keeps only the address it still has to fund or report on.
+    while True:
+        row = conn.execute("""
+            SELECT id, addr, mnemonic FROM wallet_pool
+            WHERE status='funded' AND claimed_at IS NULL ORDER BY id LIMIT 1
+        """).fetchone()
+        if row is None:
+            break
+        cur = conn.execute("""
+            UPDATE wallet_pool SET claimed_at=CURRENT_TIMESTAMP, mnemonic=NULL WHERE id=? AND claimed_at IS NULL
+        """, (row["id"],))
+        if cur.rowcount == 1:
+            return row["addr"], row["mnemonic"], True
+    # Pool is dry: hand out a fresh wallet now and fund it in the background.
+    _, addr, mnem = generate_wallet()
+    conn.execute("INSERT INTO wallet_pool(addr, claimed_at) VALUES(?,CURRENT_TIMESTAMP)", (addr,))
+    return addr, mnem, False
+
+def fund_claimed_wallets_async():
+    # A burst of registrations shares one queued pass; it funds every wallet still unfunded when it starts.
+    global _pass_queued
+    with _pass_queued_lock:
+        if _pass_queued:
+            return
+        _pass_queued = True
+    _funding_pool.submit(_run_queued_pass)
+
+def _run_queued_pass():
+    global _pass_queued
+    with _pass_queued_lock:
+        _pass_queued = False
+    try:
+        fund_pending_wallets()
+    except Exception as e:
+        count_swallowed("wallet_funding", e)
+        print("Wallet pool funding warning:", e)
+
+def refill_wallet_pool():
+    _recover_stale_funding()
+    conn = db()
+    # Unclaimed wallets count whatever their funding state; they all end up in the pool.
+    available = conn.execute("SELECT COUNT(*) FROM wallet_pool WHERE claimed_at IS NULL").fetchone()[0]
+    missing = max(0, WALLET_POOL_TARGET - available)
+    conn.executemany("INSERT INTO wallet_pool(addr, mnemonic) VALUES(?,?)",
+                     [generate_wallet()[1:] for _ in range(missing)])
+    conn.commit()
+    conn.close()
+    return fund_pending_wallets()
+
+def fund_pending_wallets() -> int:
+    # Claimed wallets are funded first, since someone is already waiting on them.
+    funded = 0
+    with _funding_lock:
+        while True:
+            conn = db()
+            rows = conn.execute("""
+                UPDATE wallet_pool SET status='funding', status_at=CURRENT_TIMESTAMP
+                WHERE id IN (
+                  SELECT id FROM wallet_pool WHERE status='unfunded'
+                  ORDER BY claimed_at IS NULL, id LIMIT ?
+                )
+                RETURNING addr
+            """, (MAX_GROUP_SIZE * 4,)).fetchall()
+            conn.commit()
+            conn.close()
+            if not rows:
+                return funded
+            addrs = [r["addr"] for r in rows]
+            try:
+                fund_accounts_batch(addrs, WALLET_FUND_MICROALGOS, on_submitted=_record_funding_txid)
+            except Exception as e:
+                count_swallowed("wallet_funding", e)
+                print("Wallet pool funding warning:", e)
+                _reset_unsubmitted(addrs)
+                return funded
+            _mark_funded(addrs)
+            funded += len(addrs)
+
+def _record_funding_txid(addrs, txid: str):
+    marks = ",".join("?" * len(addrs))
+    conn = db()
+    conn.execute(f"UPDATE wallet_pool SET funding_txid=? WHERE addr IN ({marks})", (txid, *addrs))
+    conn.commit()
+    conn.close()
+
+def _mark_funded(addrs):
+    marks = ",".join("?" * len(addrs))
+    conn = db()
+    conn.execute(f"""
+        UPDATE wallet_pool SET status='funded', funded_at=CURRENT_TIMESTAMP, status_at=CURRENT_TIMESTAMP
+        WHERE addr IN ({marks})
+    """, addrs)
+    conn.commit()
+    conn.close()
+
+def _reset_unsubmitted(addrs):
+    # Groups that reached the network keep their txid and are settled by the stale sweep.
+    marks = ",".join("?" * len(addrs))
+    conn = db()
+    conn.execute(f"""
+        UPDATE wallet_pool SET status='unfunded', status_at=CURRENT_TIMESTAMP
+        WHERE addr IN ({marks}) AND funding_txid IS NULL
+    """, addrs)
+    conn.commit()
+    conn.close()
+
+def _recover_stale_funding():
+    conn = db()
+    rows = conn.execute("""
+        SELECT addr, funding_txid FROM wallet_pool
+        WHERE status='funding' AND status_at < datetime('now', ?)
+    """, (f"-{WALLET_FUNDING_STALE_SECONDS} seconds",)).fetchall()
+    conn.close()
+    for row in rows:
+        info = None
+        if row["funding_txid"]:
+            try:
+                info = pending_info(row["funding_txid"])
+            except AlgodHTTPError:
+                info = None
+        if info and info.get("confirmed-round"):
+            _mark_funded([row["addr"]])
+        elif info is None or info.get("pool-error"):
+            # A 404 also follows a confirmation once algod forgets it, so the balance decides.
+            try:
+                funded = account_balance(row["addr"]) > 0
+            except AlgodHTTPError as e:
+                count_swallowed("wallet_funding_recovery", e)
+                continue
+            if funded:
+                _mark_funded([row["addr"]])
+                continue
+            conn = db()
+            conn.execute("""
+                UPDATE wallet_pool SET status='unfunded', funding_txid=NULL, status_at=CURRENT_TIMESTAMP
+                WHERE addr=? AND status='funding'
+            """, (row["addr"],))
+            conn.commit()
+            conn.close()
+
+def wallet_pool_stats():
+    conn = db()
+    row = conn.execute("""
+        SELECT
+          SUM(status='funded' AND claimed_at IS NULL) AS ready,
+          SUM(status<>'funded' AND claimed_at IS NULL) AS refilling,
+          SUM(status<>'funded' AND claimed_at IS NOT NULL) AS claimed_awaiting_funds,
+          SUM(claimed_at IS NOT NULL) AS claimed_total,
+          SUM(funded_at >= datetime('now', '-10 minutes')) AS funded_last_10m
+        FROM wallet_pool
+    """).fetchone()
+    conn.close()
+    stats = {k: row[k] or 0 for k in row.keys()}
+    stats["target"] = WALLET_POOL_TARGET
+    stats["refill_rate_per_min"] = round(stats["funded_last_10m"] / 10, 2)
+    return stats